@@ -0,0 +1,106 @@
+"""convert whole folders of recordings on a process pool, skipping files converted before"""
+from typing import Dict, List, Tuple, Callable, Optional, Iterable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from argparse import ArgumentParser
+import json
+from os import stat, replace, cpu_count
+from os.path import join, basename, isfile
+
+from .breath import emka
+from .motion import phenomaster
+
+MANIFEST_NAME = '.converted.{}.json'
+
+
+class Manifest(object):
+    """(size, mtime) of each converted source file in a folder, saved as json in the folder, one per
+    conversion kind"""
+    def __init__(self, folder: str, kind: str) -> None:
+        self.file_path = join(folder, MANIFEST_NAME.format(kind))
+        self.entries: Dict[str, List[int]] = dict()
+        if isfile(self.file_path):
+            with open(self.file_path, 'r') as fp:
+                self.entries = json.load(fp)
+
+    @staticmethod
+    def _key(file_path: str) -> Tuple[str, List[int]]:
+        file_stat = stat(file_path)
+        return basename(file_path), [file_stat.st_size, file_stat.st_mtime_ns]
+
+    def is_current(self, file_path: str) -> bool:
+        name, identity = self._key(file_path)
+        return self.entries.get(name) == identity
+
+    def update(self, file_path: str) -> None:
+        name, identity = self._key(file_path)
+        self.entries[name] = identity
+
+    def save(self) -> None:
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as fp:
+            json.dump(self.entries, fp, indent=4)
+        replace(temp_path, self.file_path)
+
+
+def _emka_jobs(folder: str) -> Iterable[Tuple[str, tuple]]:
+    return ((source, (source, target)) for source, target in emka.find_new_files(folder))
+
+
+def _motion_jobs(folder: str) -> Iterable[Tuple[str, tuple]]:
+    return ((source, (source,)) for source in phenomaster.find_new_files(folder))
+
+
+def _convert_and_score(source: str, target: str) -> None:
+    from ..time_series.pipeline import convert_and_score
+    convert_and_score(source, target)
+
+
+KINDS: Dict[str, Tuple[Callable[[str], Iterable[Tuple[str, tuple]]], Callable[..., None]]] = {
+    'emka': (_emka_jobs, emka.convert_file), 'motion': (_motion_jobs, phenomaster.convert_data),
+    'motion_columnar': (_motion_jobs, phenomaster.convert_columnar),
+    'emka_scored': (_emka_jobs, _convert_and_score)}
+
+
+def convert_folder(folder: str, kind: str, workers: Optional[int] = None, force: bool = False) -> List[str]:
+    """convert the new or changed recordings in folder, one file per worker process
+    Args:
+        folder: folder with the exported recordings
+        kind: one of KINDS, 'emka' for pasted plethysmograph traces, 'motion' for phenomaster csv to
+            per animal npz files, 'motion_columnar' for phenomaster csv to one [animal, time] store,
+            'emka_scored' for emka pastes converted and scored for pauses in one pass
+        workers: number of worker processes, defaults to the number of cpus
+        force: convert all files, even those in the manifest
+    Returns:
+        source files converted successfully
+    """
+    find_jobs, func = KINDS[kind]
+    manifest = Manifest(folder, kind)
+    jobs = [(source, args) for source, args in find_jobs(folder) if force or not manifest.is_current(source)]
+    converted: List[str] = list()
+    if not jobs:
+        return converted
+    with ProcessPoolExecutor(max_workers=min(workers or cpu_count() or 1, len(jobs))) as pool:
+        futures = {pool.submit(func, *args): source for source, args in jobs}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                future.result()
+            except Exception as e:  # one bad file should not stop the batch
+                print("failed to convert {}: {!r}".format(source, e))
+                continue
+            manifest.update(source)
+            manifest.save()
+            converted.append(source)
+            print("\tconverted {}".format(source))
+    return converted
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = ArgumentParser(description="convert folders of emka pastes or phenomaster exports")
+    parser.add_argument('kind', choices=sorted(KINDS))
+    parser.add_argument('folders', nargs='+')
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes, default: cpu count")
+    parser.add_argument('-f', '--force', action='store_true', help="reconvert files in the manifest")
+    args = parser.parse_args(argv)
+    for folder in args.folders:
+        convert_folder(folder, args.kind, args.workers, args.force)
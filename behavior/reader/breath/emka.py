@@ -1,14 +1,20 @@
 """read pasted plethysmograph trace file from emka"""
-from typing import Tuple, Generator, List
+from typing import IO, AnyStr, Tuple, Generator, List, Iterable, Iterator, Callable, Optional, Union
 import time
 from itertools import islice
-from os import scandir, chdir
-from os.path import splitext
+from os import scandir
+from os.path import splitext, join
 
 import noformat
 import numpy as np
+from numba import njit
 from uifunc import FolderSelector
 
+from .recording import Recording, Segment
+from ...utils.instrument import stage
+
+CHUNK_SIZE = 1 << 22  # characters read from the paste at a time
+
 
 def _extract_time(value: str) -> float:
     time_in_s, time_in_ms = value.split('.')
@@ -16,22 +22,247 @@ def _extract_time(value: str) -> float:
     return time.mktime(time.strptime(time_in_s, time_fmt)) + float(time_in_ms) / 1000
 
 
+def _iter_chunks(source: IO[AnyStr], chunk_size: int = CHUNK_SIZE) -> Iterator[AnyStr]:
+    """read fixed size blocks of text or bytes, each cut at the last full line, without the trailing
+    newline"""
+    remainder = source.read(0)
+    newline = '\n' if isinstance(remainder, str) else b'\n'
+    while True:
+        block = source.read(chunk_size)
+        if not block:
+            break
+        block = remainder + block if remainder else block
+        cut = block.rfind(newline)
+        if cut < 0:
+            remainder = block
+            continue
+        remainder = block[cut + 1:]
+        yield block[:cut]
+    if remainder:
+        yield remainder
+
+
+class SampleBuffer(object):
+    """in memory float32 array that doubles its capacity when full"""
+    def __init__(self, capacity: int = 1 << 16) -> None:
+        self._array = np.empty(capacity, dtype=np.float32)
+        self.size = 0
+
+    def extend(self, values: np.ndarray) -> None:
+        end = self.size + len(values)
+        if end > len(self._array):
+            new_array = np.empty(max(end, len(self._array) * 2), dtype=np.float32)
+            new_array[0: self.size] = self._array[0: self.size]
+            self._array = new_array
+        self._array[self.size: end] = values
+        self.size = end
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._array[0: self.size]
+
+
+class NpyWriter(object):
+    """append float32 samples straight to a .npy file, the header is rewritten with the final
+    length on close, so memory use does not depend on recording length"""
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self.size = 0
+        self._fp = open(file_path, 'wb')
+        self._write_header()
+        self._offset = self._fp.tell()
+
+    def _write_header(self) -> None:
+        np.lib.format.write_array_header_1_0(self._fp, {'descr': '<f4', 'fortran_order': False,
+                                                        'shape': (self.size,)})
+
+    def extend(self, values: np.ndarray) -> None:
+        np.asarray(values, dtype='<f4').tofile(self._fp)
+        self.size += len(values)
+
+    def close(self) -> None:
+        if self._fp.closed:
+            return
+        self._fp.seek(0)
+        self._write_header()
+        if self._fp.tell() != self._offset:
+            raise IOError('npy header changed size, file corrupted', self.file_path)
+        self._fp.close()
+
+    @property
+    def data(self) -> np.ndarray:
+        self.close()
+        return np.load(self.file_path, mmap_mode='r')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_VALUE_COLUMNS = (13, 21)
+_POWERS = np.array([float(10 ** x) for x in range(16)])  # exact powers of ten
+_BLANK, _PARSED, _UNKNOWN, _DATE = 0, 1, 2, 3
+
+
+@njit(cache=True)
+def _is_space(char: int) -> bool:
+    return char == 32 or 9 <= char <= 13
+
+
+@njit(cache=True)
+def _scan_lines(raw, first, last, powers):
+    """scan a block of whole lines in one compiled call: the bounds of each line, lines starting with
+    "Date" marked _DATE and the fixed width column [first, last) of all others parsed in the plain form
+    [spaces][sign]digits[.digits][spaces]. Fields are read from the right, where the right aligned
+    digits line up from row to row, so the loops do not branch on the sign. Mantissa and power of ten
+    are both exact in float64, so the division rounds like float() does. Blank fields are marked
+    _BLANK, anything else _UNKNOWN.
+    Returns:
+        line starts, line ends (exclusive, without the newline), values, status of each line
+    """
+    line_no = 1
+    for idx in range(len(raw)):
+        line_no += raw[idx] == 10
+    starts, ends = np.empty(line_no, np.int64), np.empty(line_no, np.int64)
+    values, status = np.zeros(line_no), np.empty(line_no, np.int8)
+    row = 0
+    for idx in range(len(raw)):
+        if raw[idx] == 10:
+            ends[row] = idx
+            row += 1
+    ends[row] = len(raw)
+    start = 0
+    for row in range(line_no):
+        starts[row], end = start, ends[row]
+        low, high = start + first, min(start + last, end)
+        is_date = end - start >= 4 and raw[start] == 68 and raw[start + 1] == 97 and raw[start + 2] == 116 \
+            and raw[start + 3] == 101
+        start = end + 1
+        if is_date:
+            status[row] = _DATE
+            continue
+        idx = high - 1
+        while idx >= low and _is_space(raw[idx]):
+            idx -= 1
+        if idx < low:
+            status[row] = _BLANK
+            continue
+        mantissa, scale, digits, decimals = 0, 1, 0, -1
+        while idx >= low:
+            char = raw[idx]
+            if 48 <= char <= 57:
+                mantissa += (char - 48) * scale
+                scale *= 10
+                digits += 1
+            elif char == 46 and decimals < 0:
+                decimals = digits
+            else:
+                break
+            idx -= 1
+        negative, plain = False, 0 < digits < len(powers)
+        if idx >= low:  # a sign or space left of the digits, and only spaces before it
+            char = raw[idx]
+            negative = char == 45
+            plain &= negative or char == 43 or _is_space(char)
+            for pad in range(low, idx):
+                plain &= _is_space(raw[pad])
+        if not plain:
+            status[row] = _UNKNOWN
+            continue
+        value = mantissa / powers[max(decimals, 0)]
+        values[row] = -value if negative else value
+        status[row] = _PARSED
+    return starts, ends, values, status
+
+
+def _try_float(value: bytes) -> Tuple[bool, float]:
+    try:
+        return True, float(value)
+    except ValueError:
+        return False, np.nan
+
+
 class EmkaDecoder(object):
     """decode the pasted emka raw data, assuming a one big paste"""
     freq = 2000.0
 
-    def __init__(self, lines):
+    def __init__(self, lines: Iterable[str], sink=None) -> None:
+        """
+        Args:
+            lines: lines of the paste, for large files use EmkaDecoder.from_file instead
+            sink: receives decoded samples through extend(array), defaults to an in memory SampleBuffer
+        """
         self.start_time = None
-        self._data: List[float] = list()
+        self._segments: List[Tuple[int, float]] = list()
+        self._data = SampleBuffer() if sink is None else sink
+        self._chunk: List[float] = list()
         self.lines = lines
         self.line_reader = self.header_reader
-        for line in self.lines:
+        self.feed('\n'.join(lines))
+
+    @classmethod
+    def from_file(cls, source: IO[AnyStr], sink=None, chunk_size: int = CHUNK_SIZE) -> "EmkaDecoder":
+        """stream decode an opened paste file, reading chunk_size characters at a time. Files opened in
+        binary mode skip decoding the text and are the fastest."""
+        decoder = cls([], sink)
+        with stage('emka.decode') as frame:
+            for block in _iter_chunks(source, chunk_size):
+                decoder.feed(block)
+            frame.samples = decoder._data.size
+        return decoder
+
+    def feed(self, block: Union[str, bytes]) -> None:
+        """decode a block of whole lines. Only lines starting with "Date" go through the line readers,
+        the body lines in between are parsed in bulk from their fixed width value column."""
+        if not block:
+            return
+        if not block.isascii():
+            self.feed_lines((block if isinstance(block, str) else block.decode()).split('\n'))
+            return
+        text = block.encode('ascii') if isinstance(block, str) else block
+        starts, ends, values, status = _scan_lines(np.frombuffer(text, np.uint8), *_VALUE_COLUMNS, _POWERS)
+        row = 0
+        for date_row in np.flatnonzero(status == _DATE):
+            if self.line_reader == self.body_reader:
+                self._take_body(text, starts, ends, values, status, row, date_row)
+            self.line_reader(text[starts[date_row]: ends[date_row]].decode('ascii'))
+            row = date_row + 1
+        if self.line_reader == self.body_reader:
+            self._take_body(text, starts, ends, values, status, row, len(ends))
+
+    def _take_body(self, text: bytes, starts: np.ndarray, ends: np.ndarray, values: np.ndarray,
+                   status: np.ndarray, first_row: int, last_row: int) -> None:
+        """samples of the scanned body lines [first_row, last_row), lines the fast parser could not read
+        are retried with float()"""
+        values, status = values[first_row: last_row], status[first_row: last_row]
+        keep = status == _PARSED
+        first, last = _VALUE_COLUMNS
+        for row in np.flatnonzero(status == _UNKNOWN):  # exponents, nan and the like
+            start, end = starts[first_row + row], ends[first_row + row]
+            keep[row], values[row] = _try_float(text[start + first: min(start + last, end)])
+        self._data.extend(values[keep].astype(np.float32))
+
+    def feed_lines(self, lines: Iterable[str]) -> None:
+        """decode line by line, slow but takes any text"""
+        for line in lines:
             self.line_reader(line)
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._chunk:
+            self._data.extend(np.array(self._chunk, dtype='float32'))
+            self._chunk.clear()
 
     def header_reader(self, line):
         if line[0:4] == "Date" and line[17:22] == 'first':
             print(line.split('\t')[1].strip())
-            self.start_time = _extract_time(line.split('\t')[1].strip())
+            segment_start = _extract_time(line.split('\t')[1].strip())
+            if self.start_time is None:
+                self.start_time = segment_start
+            self._flush()  # samples of the previous segment, when fed line by line
+            self._segments.append((self._data.size, segment_start))
             self.lines = islice(self.lines, 3, None)
             self.line_reader = self.body_reader
 
@@ -42,19 +273,45 @@ class EmkaDecoder(object):
             return
         else:
             try:
-                self._data.append(float(line[13:21]))
+                self._chunk.append(float(line[13:21]))
             except ValueError:
                 return
 
     @property
     def data(self):
-        return np.array(self._data, dtype='float32')
+        return self._data.data
+
+    @property
+    def segments(self) -> List[Segment]:
+        """(sample offset, sample count, start timestamp) of each "Date ... first" block"""
+        ends = [offset for offset, _ in self._segments[1:]] + [self._data.size]
+        return [(offset, end - offset, start) for (offset, start), end in zip(self._segments, ends)]
+
+
+def read_segments(file_name: str) -> List[Segment]:
+    """segment index of a converted file, files converted before the index existed are one segment"""
+    return Recording(file_name).segments
+
+
+def load_segment(file_name: str, index: int) -> Tuple[float, np.ndarray]:
+    """read one "Date ... first" block of a converted file without loading the rest
+    Returns:
+        start timestamp of the block, samples
+    """
+    segment = Recording(file_name).segment(index)
+    return segment.start, np.array(segment.value)
+
+
+def load_time_range(file_name: str, start: float, end: float) -> List[Tuple[float, np.ndarray]]:
+    """read the samples recorded between two timestamps (in s, same clock as attrs['start'])
+    Returns:
+        (timestamp of the first sample, samples) for each block overlapping the range
+    """
+    return [(window.start, np.array(window.value)) for window in Recording(file_name).between(start, end)]
 
 
 def find_new_files(data_folder: str, ext: List[str] = ['.raw', '.txt']) -> Generator[Tuple[str, str], None, None]:
-    file_list = scandir(data_folder)
-    chdir(data_folder)
-    for file_entry in file_list:
+    for file_entry in scandir(data_folder):
         file_base, file_ext = splitext(file_entry.path)
         source_name = file_entry.path
         target_name = file_base
@@ -64,12 +321,40 @@ def find_new_files(data_folder: str, ext: List[str] = ['.raw', '.txt']) -> Gener
 
 @FolderSelector
 def convert(folder_name: str):
-    for file_name, target_name in find_new_files(folder_name):
-        try:
-            with open(file_name, 'r') as source, noformat.File(target_name, 'w-') as output:
-                decoder = EmkaDecoder(source.read().split('\n'))
-                output.attrs['start'] = decoder.start_time
-                output.attrs['freq'] = decoder.freq
-                output['value'] = decoder.data
-        except IOError as e:
-            print(e)
+    from ..batch import convert_folder
+    convert_folder(folder_name, 'emka')
+
+
+def convert_file(file_name: str, target_name: str, mode: str = 'w') -> None:
+    """convert one pasted text file into a noformat file with the trace in 'value'"""
+    with open(file_name, 'rb') as source:
+        convert_stream(source, target_name, mode)
+
+
+class _Tap(object):
+    """sink passing each decoded chunk to a callback after storing it"""
+    def __init__(self, sink, callback: Callable[[np.ndarray], None]) -> None:
+        self.sink, self.callback = sink, callback
+
+    @property
+    def size(self) -> int:
+        return self.sink.size
+
+    def extend(self, values: np.ndarray) -> None:
+        self.sink.extend(values)
+        self.callback(values)
+
+
+def convert_stream(source: IO[AnyStr], target_name: str, mode: str = 'w',
+                   tap: Optional[Callable[[np.ndarray], None]] = None) -> None:
+    """convert a paste read from an open text or binary stream, e.g. io.StringIO of a clipboard paste
+    Args:
+        tap: called with every decoded chunk of samples, to process the trace while it is converted
+    """
+    with stage('emka.convert') as frame, noformat.File(target_name, mode) as output:
+        with NpyWriter(join(target_name, 'value.npy')) as sink:
+            decoder = EmkaDecoder.from_file(source, sink if tap is None else _Tap(sink, tap))
+        output.attrs['start'] = decoder.start_time
+        output.attrs['freq'] = decoder.freq
+        output.attrs['segments'] = decoder.segments
+        frame.samples = sink.size
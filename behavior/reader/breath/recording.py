@@ -0,0 +1,108 @@
+"""time indexed access to converted emka files without reading the whole trace"""
+from typing import Iterator, List, Optional, Tuple
+from os.path import join
+
+import noformat
+import numpy as np
+
+Segment = Tuple[int, int, float]
+
+
+class Recording(object):
+    """a converted breath file, or a time window of one. The trace is memory mapped, so slicing a few
+    minutes out of a 10 hour recording only reads those minutes. recording['value'] gives the samples
+    like a noformat File, so recordings and windows go directly into pause_count and friends. The length
+    is the number of samples in the window, not a count of items.
+
+    Args:
+        file_name: folder of the converted noformat file
+    Examples:
+        >>> recording = Recording(file_name)
+        >>> pause_count(recording[600: 900])  # 5 min, starting 10 min into the recording
+        >>> recording.between(start_timestamp, start_timestamp + 300.0)  # the same on the wall clock
+    """
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+        self.attrs = noformat.File(file_name).attrs
+        self.freq = float(self.attrs['freq'])
+        self._value = np.load(join(file_name, 'value.npy'), mmap_mode='r')
+        self._first = 0
+        self._last = len(self._value)
+
+    def _window(self, first: int, last: int) -> "Recording":
+        window = object.__new__(Recording)
+        window.__dict__.update(self.__dict__)
+        window._first, window._last = first, last
+        return window
+
+    @property
+    def value(self) -> np.ndarray:
+        """memory mapped samples of this window"""
+        return self._value[self._first: self._last]
+
+    @property
+    def duration(self) -> float:
+        return len(self) / self.freq
+
+    @property
+    def offset(self) -> float:
+        """seconds from the first sample of the file to the first sample of this window"""
+        return self._first / self.freq
+
+    @property
+    def segments(self) -> List[Segment]:
+        """(offset, length, start timestamp) of each continuous block inside this window"""
+        segments = self.attrs.get('segments', [(0, len(self._value), self.attrs['start'])])
+        result = list()
+        for offset, length, start in segments:
+            first, last = max(offset, self._first), min(offset + length, self._last)
+            if first < last:
+                result.append((first - self._first, last - first, start + (first - offset) / self.freq))
+        return result
+
+    @property
+    def start(self) -> float:
+        """timestamp of the first sample"""
+        return self.segments[0][2]
+
+    def __len__(self) -> int:
+        return self._last - self._first
+
+    def __getitem__(self, key):
+        """recording['value'] gives the samples, recording[a: b] the window from a to b seconds after the
+        first sample of this recording, both ends clipped like list slices"""
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ValueError("recording windows do not take a step, decimate the value instead")
+            first = 0 if key.start is None else int(np.ceil(key.start * self.freq))
+            last = len(self) if key.stop is None else int(np.ceil(key.stop * self.freq))
+            first, last, _ = slice(first, last).indices(len(self))
+            return self._window(self._first + first, self._first + max(first, last))
+        if key == 'value':
+            return self.value
+        raise KeyError(key)
+
+    def segment(self, index: int) -> "Recording":
+        """one "Date ... first" block of this recording"""
+        offset, length, _ = self.segments[index]
+        return self._window(self._first + offset, self._first + offset + length)
+
+    def between(self, start: float, end: float) -> List["Recording"]:
+        """windows recorded between two timestamps (in s, same clock as attrs['start']),
+        one for each block overlapping the range"""
+        result = list()
+        for offset, length, seg_start in self.segments:
+            first = max(int(np.ceil((start - seg_start) * self.freq)), 0)
+            last = min(int(np.ceil((end - seg_start) * self.freq)), length)
+            if first < last:
+                result.append(self._window(self._first + offset + first, self._first + offset + last))
+        return result
+
+    def chunks(self, duration: float, overlap: Optional[float] = None) -> Iterator["Recording"]:
+        """consecutive windows of duration seconds, each extended back by overlap seconds"""
+        step, pad = int(duration * self.freq), int((overlap or 0.0) * self.freq)
+        for first in range(0, len(self), step):
+            yield self._window(self._first + max(first - pad, 0), self._first + min(first + step, len(self)))
+
+    def __repr__(self) -> str:
+        return "Recording({!r})[{:.3f}: {:.3f}]".format(self.file_name, self.offset, self.offset + self.duration)
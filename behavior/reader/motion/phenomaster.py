@@ -1,34 +1,109 @@
-from typing import List, Dict, Sequence, Iterable
-from os import makedirs, scandir, DirEntry
-from os.path import splitext, join, dirname
+from typing import List, Dict, Sequence, Iterable, Iterator, Union, Tuple
+from os import makedirs, scandir, DirEntry, fspath
+from os.path import splitext, join, dirname, basename
+from io import StringIO
 import numpy as np
+import pandas as pd
 
+import noformat
 from uifunc import FolderSelector
 
+from ...utils.instrument import instrumented, stage
+
+CHANNELS = ('XT', 'XA', 'XF')
+
 @FolderSelector  # only public interface
 def convert(folder_name: str) -> None:
+    from ..batch import convert_folder
+    convert_folder(folder_name, 'motion')
+
+def find_new_files(folder_name: str) -> Iterator[str]:
     for file in scandir(folder_name):
         if file.is_file() and splitext(file.name)[-1][1:].lower() in ("csv", "raw"):
-            convert_data(file)
+            yield file.path
         elif file.is_file() and splitext(file.name)[-1].lower().startswith('.txt'):
             if file.stat().st_size > 1E7:
-                convert_data(file)
+                yield file.path
 
-def convert_data(file_entry: DirEntry) -> None:
+@instrumented('phenomaster.convert')
+def convert_data(file_entry: Union[DirEntry, str]) -> None:
     """convert csv data to pandas msgpack"""
-    with open(file_entry.path, 'r') as fp:
+    file_path = fspath(file_entry)
+    file_name = basename(file_path)
+    with open(file_path, 'r') as fp:
         try:
             data = read(fp.read())
         except IndexError as e:
-            print(file_entry.name)
+            print(file_name)
             raise e
     for animal_id, animal_data in data.items():
-        base_folder = dirname(dirname(file_entry.path))
+        base_folder = dirname(dirname(file_path))
         makedirs(join(base_folder, animal_id), exist_ok=True)
-        np.savez_compressed(join(base_folder, animal_id, splitext(file_entry.name)[0]), **animal_data)
+        np.savez_compressed(join(base_folder, animal_id, splitext(file_name)[0]), **animal_data)
+
+@instrumented('phenomaster.convert_columnar')
+def convert_columnar(file_entry: Union[DirEntry, str]) -> None:
+    """convert csv data to one noformat file per export, next to the per animal folders. Each channel
+    is an uncompressed [animal, time] array, so a cohort can be memory mapped and sliced, see load_columns"""
+    file_path = fspath(file_entry)
+    with open(file_path, 'r') as fp:
+        animal_ids, cage_ids, time, channels = read_columns(fp.read())
+    target = join(dirname(dirname(file_path)), splitext(basename(file_path))[0])
+    with noformat.File(target, 'w') as output:
+        output['time'] = time
+        for key, value in channels.items():
+            output[key] = value
+        output.attrs['animal_id'] = animal_ids
+        output.attrs['cage_id'] = cage_ids
+        if all(x.isdigit() for x in animal_ids):
+            output.attrs['id'] = [int(x) for x in animal_ids]
 
+def load_columns(file_name: str) -> Tuple[List[str], List[int], np.ndarray, Dict[str, np.ndarray]]:
+    """memory map an export written by convert_columnar
+    Returns:
+        animal ids, cage ids, shared time in minutes, {channel: [animal, time] array}
+    """
+    attrs = noformat.File(file_name).attrs
+    channels = {key: np.load(join(file_name, key + '.npy'), mmap_mode='r') for key in CHANNELS}
+    return attrs['animal_id'], attrs['cage_id'], np.load(join(file_name, 'time.npy')), channels
+
+@instrumented('phenomaster.read')
 def read(csv_file: str) -> Dict[str, Dict[str, np.ndarray]]:
-    lines = csv_file.split('\n')
+    return _read_animals(csv_file, _read_header(csv_file))
+
+def _read_animals(csv_file: str, header: Tuple[List[str], List[int], bool, int]) -> Dict[str, Dict[str, np.ndarray]]:
+    animal_ids, cage_ids, long_form, data_start = header
+    if long_form:  # saved as long form
+        return dict(zip(animal_ids, _read_long_form(_skip_lines(csv_file, data_start), cage_ids)))
+    else:  # saved as wide form
+        try:
+            return dict(zip(animal_ids, _read_wide_form(_skip_lines(csv_file, data_start), cage_ids)))
+        except ValueError as e:
+            print("animals: ", animal_ids)
+            print("cages: ", cage_ids)
+            raise e
+
+def read_columns(csv_file: str) -> Tuple[List[str], List[int], np.ndarray, Dict[str, np.ndarray]]:
+    """read an export as [animal, time] arrays on the shared time axis. Raises ValueError when the
+    animals were not recorded for the same number of samples.
+    Returns:
+        animal ids, cage ids, time in minutes, {channel: [animal, time] array}
+    """
+    header = _read_header(csv_file)
+    data = list(_read_animals(csv_file, header).values())
+    time = data[0]['time']
+    lengths = {len(time)} | {len(animal['XT']) for animal in data}
+    if len(lengths) > 1:
+        raise ValueError("animals recorded for different lengths: {}".format(sorted(lengths)))
+    channels = {key: np.stack([animal[key] for animal in data]) for key in CHANNELS}
+    return header[0], header[1], time, channels
+
+def _read_header(csv_file: str) -> Tuple[List[str], List[int], bool, int]:
+    """
+    Returns:
+        animal ids, cage ids, whether saved in long form, line number of the first data row
+    """
+    lines = csv_file.split('\n', 10)[0: 10]  # the header, at most 5 animals per export
     animal_ids: List[str] = list()
     cage_ids: List[int] = list()
     for line in lines[3: 8]:
@@ -38,55 +113,65 @@ def read(csv_file: str) -> Dict[str, Dict[str, np.ndarray]]:
         cage_ids.append(int(cage_id))
         animal_ids.append(animal_id)
     animal_no = len(animal_ids)
-    if lines[4 + animal_no].split(';')[2].startswith("Animal No"):  # saved as long form
-        return dict(zip(animal_ids, _read_long_form(lines[4 + animal_no:], cage_ids)))
-    else:  # saved as wide form
-        try:
-            return dict(zip(animal_ids, _read_wide_form(lines[4 + animal_no:], cage_ids)))
-        except ValueError as e:
-            print("animals: ", animal_ids)
-            print("cages: ", cage_ids)
-            raise e
+    if lines[4 + animal_no].split(';')[2].startswith("Animal No"):
+        return animal_ids, cage_ids, True, 6 + animal_no
+    return animal_ids, cage_ids, False, 7 + animal_no
 
-def _read_long_form(lines: Sequence[str], cage_ids: List[int]) -> Iterable[Dict[str, np.ndarray]]:
-    results: List[List[List[int]]] = [list() for _ in range(max(cage_ids))]
-    time_list: List[int] = list()
-    starting_cage = min(cage_ids) - 1
-    for line_str in lines[2:]:
-        line = line_str.split(';')
-        if not any(line):
-            continue
-        cage_id = int(line[3]) - 1
-        if cage_id == starting_cage:
-            time_list.append(_read_time(line[1]))
-        try:
-            results[cage_id].append([int(x) for x in line[4: 7]])
-        except IndexError as e:
-            print(line, len(results), cage_id)
-            raise e
-    time = np.array(time_list)
-    time[time < time[0]] += 1440
-    for result in results:
-        if len(result) > 0:
-            result = np.asarray(result).T
-            yield {'XT': result[0], 'XA': result[1], 'XF': result[2], 'time': time}
-
-def _read_wide_form(lines: Sequence[str], cage_ids: List[int]) -> Iterable[Dict[str, np.ndarray]]:
-    time_list: List[int] = list()
-    result: List[List[int]] = list()
+def _skip_lines(text: str, line_no: int) -> str:
+    start = 0
+    for _ in range(line_no):
+        start = text.find('\n', start) + 1
+        if start == 0:
+            return ''
+    return text[start:]
+
+def _read_table(text: str, columns: Sequence[int]) -> pd.DataFrame:
+    """parse ';' separated rows in bulk, column 1 is kept as time string, the others are integers.
+    Rows that are entirely empty are dropped."""
+    with stage('phenomaster.parse') as frame:
+        table = pd.read_csv(StringIO(text), sep=';', header=None, names=range(max(columns) + 1), usecols=columns,
+                            index_col=False, dtype={1: str}).dropna(how='all')
+        frame.samples = len(table)
+    return table
+
+def _read_long_form(text: str, cage_ids: List[int]) -> Iterable[Dict[str, np.ndarray]]:
+    table = _read_table(text, [1, 3, 4, 5, 6])
+    cage = table[3].to_numpy(dtype=np.int64)
+    values = table[[4, 5, 6]].to_numpy(dtype=np.int64)
+    time = _read_times(table[1].to_numpy()[cage == min(cage_ids)])
+    order = np.argsort(cage, kind='stable')
+    _, counts = np.unique(cage[order], return_counts=True)
+    for result in np.split(values[order], np.cumsum(counts)[0: -1]):
+        result = result.T
+        yield {'XT': result[0], 'XA': result[1], 'XF': result[2], 'time': time}
+
+def _read_wide_form(text: str, cage_ids: List[int]) -> Iterable[Dict[str, np.ndarray]]:
     animal_no = len(cage_ids)
-    for line_str in lines[3:]:
-        line = line_str.split(';')
-        if all([not x for x in line]):
-            continue
-        time_list.append(_read_time(line[1]))
-        result.append([int(x) for x in line[2: animal_no * 3 + 2]])
-    results = iter(np.array(result).T)
-    time = np.array(time_list)
-    time[time < time[0]] += 1440
+    table = _read_table(text, range(1, animal_no * 3 + 2))
+    results = iter(table.iloc[:, 1:].to_numpy(dtype=np.int64).T)
+    time = _read_times(table[1].to_numpy())
     for _ in range(animal_no):
         yield {'XT': next(results), 'XA': next(results), 'XF': next(results), 'time': time}
 
-def _read_time(time_str: str) -> int:
-    hour, minute = time_str.split(':')
-    return int(hour) * 60 + int(minute)
+def _read_times(time_str: np.ndarray) -> np.ndarray:
+    """parse an array of "HH:MM" strings. The clock wraps at midnight, every wrap adds a day, so
+    recordings spanning many days keep increasing. Raises ValueError on empty or malformed cells.
+    Returns:
+        minutes since midnight of the first day
+    """
+    chars = np.char.strip(np.asarray(time_str, dtype=str)).astype(bytes)
+    chars = chars.view(np.uint8).reshape(len(chars), -1)
+    position = np.arange(chars.shape[1])
+    is_colon, is_digit = chars == 58, (chars >= 48) & (chars <= 57)
+    colon = np.argmax(is_colon, 1)[:, np.newaxis]
+    end = np.count_nonzero(chars, 1)[:, np.newaxis]
+    digits = np.where(is_digit, chars - 48, 0).astype(np.int64)
+    hour = (digits * np.where(position < colon, 10 ** np.maximum(colon - 1 - position, 0), 0)).sum(1)
+    minute = (digits * np.where(position > colon, 10 ** np.maximum(end - 1 - position, 0), 0)).sum(1)
+    bad = ((is_colon.sum(1) != 1) | ((chars != 0) & ~is_digit & ~is_colon).any(1) | (colon[:, 0] < 1)
+           | (colon[:, 0] > 2) | (end[:, 0] - colon[:, 0] != 3) | (hour > 23) | (minute > 59))
+    if bad.any():
+        row = int(np.argmax(bad))
+        raise ValueError("unreadable time {!r} in data row {}".format(np.asarray(time_str)[row], row))
+    time = hour * 60 + minute
+    return time + 1440 * np.cumsum(np.hstack([0, np.diff(time) < 0]))
@@ -0,0 +1,136 @@
+"""throughput and peak memory of the readers and breath metrics on synthetic recordings
+
+    python -m behavior.test.benchmark [--sizes 60 600 3600] [--repeat 3] [--json results.json]
+
+Sizes are recording lengths in seconds, at least 30 as get_t_in_out drops 5 s at each end. Phenomaster
+exports use the same numbers as minutes. Time is the best of repeat runs, peak memory the tracemalloc
+peak of one extra run, so tracing does not slow the timed runs. Compiled functions are warmed up before
+timing. EmkaDecoder is compared to emka.line_reader, the line by line decoder it replaced, with
+the speedup printed below the table, followed by the time a fresh worker process takes to import the
+analysis packages, against importing only their third party dependencies."""
+from typing import Callable, Dict, List, Sequence
+from io import BytesIO
+from time import perf_counter
+import argparse
+import json
+import subprocess
+import sys
+import tracemalloc
+
+import numpy as np
+
+from .data.synthetic import FREQ, breathing, emka_paste, phenomaster_csv
+
+SIZES = (60, 600, 3600)
+PACKAGES = ('behavior.time_series', 'behavior.utils')
+DEPENDENCIES = ('numpy', 'scipy.signal', 'pandas', 'numba', 'noformat')  # the baseline of import_time
+_IMPORT_SCRIPT = """
+from time import perf_counter
+start = perf_counter()
+import {}
+print(perf_counter() - start)
+"""
+
+
+def measure(func: Callable[[], object], repeat: int = 3) -> Dict[str, float]:
+    """best wall time over repeat calls and the tracemalloc peak of one more call"""
+    times = list()
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'peak_mb': peak / 2 ** 20}
+
+
+def _read_lines(paste: str) -> np.ndarray:
+    from ..reader.breath.emka import EmkaDecoder
+    decoder = EmkaDecoder([])
+    decoder.feed_lines(paste.split('\n'))
+    return decoder.data
+
+
+def _cases(size: int) -> Dict[str, tuple]:
+    """{stage: (function, amount of input, unit)} for one input size"""
+    from ..reader.breath.emka import EmkaDecoder
+    from ..reader.motion.phenomaster import read
+    from ..time_series.eami import eAMI, pause_count
+    from ..time_series.main import get_t_in_out
+    trace, _ = breathing(size, apneas=max(size // 30, 1))
+    paste = emka_paste(np.array_split(trace, 3))
+    paste_bytes = paste.encode('ascii')
+    csv = phenomaster_csv(True, size)
+    return {
+        'EmkaDecoder': (lambda: EmkaDecoder.from_file(BytesIO(paste_bytes)).data, len(paste) / 2 ** 20, 'MB'),
+        'emka.line_reader': (lambda: _read_lines(paste), len(paste) / 2 ** 20, 'MB'),
+        'phenomaster.read': (lambda: read(csv), len(csv) / 2 ** 20, 'MB'),
+        'eAMI': (lambda: eAMI(trace), len(trace) / 1E6, 'Msample'),
+        'get_t_in_out': (lambda: get_t_in_out(trace, FREQ), len(trace) / 1E6, 'Msample'),
+        'pause_count': (lambda: pause_count({'value': trace}), len(trace) / 1E6, 'Msample')}
+
+
+def run(sizes: Sequence[int] = SIZES, repeat: int = 3, stages: Sequence[str] = ()) -> List[Dict]:
+    """one row per stage and size: time, throughput and peak memory"""
+    for func, _, _ in _cases(30).values():  # compile numba functions and fill caches outside the timing
+        func()
+    result = list()
+    for size in sizes:
+        for stage, (func, amount, unit) in _cases(size).items():
+            if stages and stage not in stages:
+                continue
+            row = {'stage': stage, 'size': size, 'input': amount, 'unit': unit}
+            row.update(measure(func, repeat))
+            row['throughput'] = amount / row['seconds']
+            result.append(row)
+    return result
+
+
+def format_table(rows: List[Dict]) -> str:
+    lines = ["{:<18}{:>6}{:>17}{:>10}{:>21}{:>11}".format('stage', 'size', 'input', 'time (s)', 'throughput',
+                                                          'peak (MB)')]
+    for row in rows:
+        lines.append("{stage:<18}{size:>6}{input:>9.2f} {unit:<7}{seconds:>10.3f}{throughput:>10.2f} {unit:>7}/s"
+                     "{peak_mb:>11.1f}".format(**row))
+    return "\n".join(lines)
+
+
+def speedups(rows: List[Dict], stage: str = 'EmkaDecoder', reference: str = 'emka.line_reader') -> Dict[int, float]:
+    """{size: time of reference / time of stage}, for the sizes where both ran"""
+    seconds = {(row['stage'], row['size']): row['seconds'] for row in rows}
+    return {size: seconds[(reference, size)] / seconds[(stage, size)] for name, size in seconds
+            if name == stage and (reference, size) in seconds}
+
+
+def import_time(modules: Sequence[str], repeat: int = 3) -> float:
+    """best time over repeat fresh interpreters to import modules, interpreter start up excluded"""
+    script = _IMPORT_SCRIPT.format(", ".join(modules))
+    return min(float(subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, check=True)
+                     .stdout.decode('utf-8').splitlines()[-1]) for _ in range(repeat))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', default=(), help="only run these stages")
+    parser.add_argument('--json', help="also save the rows to this file, to compare runs")
+    args = parser.parse_args(argv)
+    rows = run(args.sizes, args.repeat, args.stages)
+    print(format_table(rows))
+    for size, ratio in speedups(rows).items():
+        print("EmkaDecoder at {} s: {:.1f}x the line reader".format(size, ratio))
+    package_time, baseline = import_time(PACKAGES, args.repeat), import_time(DEPENDENCIES, args.repeat)
+    print("import {}: {:.3f} s, their dependencies {} alone: {:.3f} s".format(
+        ", ".join(PACKAGES), package_time, ", ".join(DEPENDENCIES), baseline))
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(rows, fp, indent=4)
+
+
+if __name__ == '__main__':
+    main()
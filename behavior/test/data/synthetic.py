@@ -0,0 +1,112 @@
+"""synthetic recordings shaped like the real exports, for tests and benchmarks"""
+from typing import Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+FREQ = 2000  # emka sample rate
+CAGES = [(3, '301001'), (4, '401002'), (6, '601001'), (7, '701003'), (9, '901002')]  # at most 5 per export
+Apnea = Tuple[int, int]  # start, length in samples
+
+
+def breathing(seconds: float, freq: int = FREQ, apneas: int = 0, rate: float = 4.0,
+              seed: int = 0) -> Tuple[np.ndarray, List[Apnea]]:
+    """plethysmograph like air flow: a breathing oscillation with drifting rate and depth, baseline drift
+    and sensor noise, flattened during injected apneas of 0.5 to 2 s.
+    Args:
+        seconds: duration
+        freq: sample rate in Hz
+        apneas: number of apneas, spread over the trace without overlapping
+        rate: mean breathing rate in Hz
+    Returns:
+        trace as float32, (start, length) of each apnea in samples
+    """
+    rng = np.random.RandomState(seed)
+    length = int(seconds * freq)
+    slow = np.interp(np.arange(length), np.linspace(0, length, max(int(seconds), 2)),
+                     rng.randn(max(int(seconds), 2)))
+    phase = 2 * np.pi * np.cumsum(rate * (1.0 + 0.15 * slow)) / freq
+    depth = 1.0 + 0.2 * np.roll(slow, length // 3)
+    trace = depth * (np.sin(phase) + 0.25 * np.sin(2 * phase + 0.5))
+    trace += 0.1 * np.sin(2 * np.pi * 0.05 * np.arange(length) / freq) + 0.05 * rng.randn(length)
+    events = list()  # type: List[Apnea]
+    if apneas > 0:
+        slots = np.linspace(0, length, apneas + 1).astype(np.int64)
+        for slot_start, slot_end in zip(slots[0: -1], slots[1:]):
+            apnea = int(rng.uniform(0.5, 2.0) * freq)
+            if slot_end - slot_start <= apnea + freq:
+                continue
+            start = int(rng.randint(slot_start + freq // 2, slot_end - apnea - freq // 2 + 1))
+            trace[start: start + apnea] = 0.02 * rng.randn(apnea)
+            events.append((start, apnea))
+    return trace.astype(np.float32), events
+
+
+def _emka_clock(moment: datetime) -> str:
+    return moment.strftime("%b %d, %Y - %I:%M:%S %p") + ".{:03d}".format(moment.microsecond // 1000)
+
+
+def emka_lines(blocks: Sequence[np.ndarray], name: str = '101-2-20180105',
+               start: datetime = datetime(2018, 1, 5, 10, 30, 15, 250000), gap: float = 60.0,
+               freq: int = FREQ) -> Iterator[str]:
+    """lines of an emka paste holding one "Date ... first/last sample" block per trace, each starting
+    gap seconds after the previous one ended"""
+    yield "File : \tC:\\Data\\Emka\\{}.dat".format(name)
+    yield "Channel : \tFlow"
+    yield ""
+    for block in blocks:
+        end = start + timedelta(seconds=len(block) / freq)
+        yield "Date and time of first sample :\t{}".format(_emka_clock(start))
+        yield ""
+        yield "Time\tFlow"
+        yield "\t[ml/s]"
+        for idx, value in enumerate(block):
+            seconds, ms = divmod(idx * 1000 // freq, 1000)
+            minutes, seconds = divmod(seconds, 60)
+            yield "{:02d}:{:02d}:{:02d}.{:03d}\t{:8.5f}\t".format(minutes // 60, minutes % 60, seconds, ms, value)
+        yield "Date and time of last sample :\t{}".format(_emka_clock(end))
+        yield ""
+        start = end + timedelta(seconds=gap)
+
+
+def emka_paste(blocks: Sequence[np.ndarray], **kwargs) -> str:
+    """the whole paste as text, see emka_lines"""
+    return "\n".join(emka_lines(blocks, **kwargs)) + "\n"
+
+
+def write_emka_paste(file_path: str, blocks: Sequence[np.ndarray], **kwargs) -> None:
+    """write a paste line by line, for files too large to build as one string"""
+    with open(file_path, 'w') as fp:
+        for line in emka_lines(blocks, **kwargs):
+            fp.write(line + "\n")
+
+
+def phenomaster_csv(long_form: bool, minutes: int = 1440, cages: Sequence[Tuple[int, str]] = CAGES[0: 3],
+                    start: datetime = datetime(2018, 1, 1, 16, 40), seed: int = 1,
+                    counts: Optional[np.ndarray] = None) -> str:
+    """phenomaster export with XT, XA and XF beam counts per minute, in long form (one row per animal
+    and minute) or wide form (one row per minute), crossing midnight as real overnight exports do
+    Args:
+        counts: [minute, cage, channel] counts, random with a day/night rhythm by default
+    """
+    if counts is None:
+        rng = np.random.RandomState(seed)
+        hours = np.array([(start + timedelta(minutes=x)).hour for x in range(minutes)])
+        activity = np.where((hours >= 19) | (hours < 7), 300, 60)
+        counts = rng.poisson(activity[:, np.newaxis, np.newaxis] * [1.0, 0.6, 0.2], (minutes, len(cages), 3))
+    lines = ["TSE Phenomaster export", "", "Box;Animal No.;Weight"]
+    lines.extend("{};{};25.0".format(cage, animal) for cage, animal in cages)
+    lines.append("")
+    moments = [start + timedelta(minutes=x) for x in range(minutes)]
+    stamps = ["{};{}:{:02d}".format(x.strftime("%d.%m.%Y"), x.hour, x.minute) for x in moments]
+    if long_form:
+        lines.extend(["Date;Time;Animal No.;Box;XT;XA;XF", ";;;[min];[cnt];[cnt];[cnt]"])
+        for stamp, row in zip(stamps, counts):
+            lines.extend("{};{};{};{};{};{}".format(stamp, animal, cage, *values)
+                         for (cage, animal), values in zip(cages, row))
+            lines.append(";;;;;;")
+    else:
+        lines.extend(["Date;Time;" + ";".join("XT;XA;XF" for _ in cages),
+                      ";;" + ";".join(["[cnt]"] * (3 * len(cages))), ""])
+        lines.extend("{};".format(stamp) + ";".join(map(str, row.ravel())) for stamp, row in zip(stamps, counts))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,74 @@
+import numpy as np
+from scipy.ndimage import gaussian_filter1d
+from noformat import File
+from ..time_series.algorithm import recursive_gaussian, find_runs, boolean2index
+from ..time_series.pyramid import Pyramid
+from ..time_series.main import get_t_in_out, get_t_in_out_windowed, peak_valley
+
+
+def test_recursive_gaussian():
+    trace = np.random.RandomState(0).randn(100000).cumsum()
+    for sigma in (3.0, 50.0, 2000.0):
+        expected = gaussian_filter1d(trace, sigma, mode='nearest')
+        result = recursive_gaussian(trace, sigma)
+        assert np.abs(result - expected).max() < 0.01 * np.ptp(trace)
+    for sigma in (1.0, 20.0, 2000.0):
+        impulse = np.zeros(int(sigma * 40) + 1)
+        impulse[len(impulse) // 2] = 1.0
+        kernel = recursive_gaussian(impulse, sigma)
+        expected = gaussian_filter1d(impulse, sigma, mode='constant')
+        assert abs(kernel.sum() - 1) < 1E-6 and np.abs(kernel - expected).max() < 0.1 * expected.max()
+    stacked = recursive_gaussian(np.vstack([trace, trace]).T, 50.0, axis=0)
+    assert np.allclose(stacked[:, 1], recursive_gaussian(trace, 50.0))
+
+
+def test_t_in_out_windowed():
+    time = np.arange(2000 * 180) / 2000.0
+    rate = np.where(time < 90, 3.0, 5.0)
+    trace = np.sin(2 * np.pi * np.cumsum(rate) / 2000.0) + 0.2 * np.sin(2 * np.pi * 0.05 * time)
+    t_in, t_out = get_t_in_out(trace[0: 2000 * 80])
+    windows = get_t_in_out_windowed(trace, window=30.0, step=10.0)
+    assert np.array_equal(windows['start'], np.arange(0, 151, 10))
+    assert abs(windows['t_in'][2] - t_in.mean()) < 0.01 and abs(windows['t_out'][2] - t_out.mean()) < 0.01
+    assert np.allclose(windows['t_in'][[1, -1]], [1 / 6, 1 / 10], rtol=0.05)
+    assert 80 < windows['n_in'][3] < 100
+
+
+def test_peak_valley():
+    time = np.arange(2000 * 60) / 2000.0
+    trace = np.sin(2 * np.pi * 2.5 * time) + np.random.RandomState(0).randn(len(time)) * 0.05
+    breaths = peak_valley(trace, min_amplitude=0.5)
+    assert 148 <= len(breaths) <= 150
+    assert abs(np.mean(breaths['duration']) - 0.4) < 0.005 and np.all(breaths['amplitude'] > 1.5)
+    assert np.all(breaths['onset'] < breaths['peak']) and np.all(breaths['peak'] < breaths['offset'])
+    assert len(peak_valley(np.zeros(1000))) == 0
+
+
+def test_find_runs():
+    trace = np.random.RandomState(1).randn(5000).cumsum()
+    for thresh in (trace.min() - 1, 0.0, np.median(trace)):
+        start, length = find_runs(trace, thresh)
+        expected_start, expected_length = boolean2index(trace > thresh)
+        assert np.array_equal(start, expected_start) and np.array_equal(length, expected_length)
+    trace = np.array([0, 2, 2, 0, 2, 1, 1, 2, 0, 0, 0, 2, 2, 2, 0], dtype=float)
+    assert [x.tolist() for x in find_runs(trace, 1.5)] == [[1, 4, 7, 11], [2, 1, 1, 3]]
+    assert [x.tolist() for x in find_runs(trace, 1.5, 0.5)] == [[1, 4, 11], [2, 4, 3]]
+    assert [x.tolist() for x in find_runs(trace, 1.5, max_gap=3)] == [[1, 11], [7, 3]]
+    assert [x.tolist() for x in find_runs(trace, 1.5, max_gap=3, min_length=4)] == [[1], [7]]
+
+
+def test_pyramid(tmpdir):
+    trace = np.random.RandomState(2).randn(2000 * 600)
+    pyramid = Pyramid.build(trace, 2000.0)
+    assert pyramid.levels[-1].shape[0] * 2 <= 4000
+    time, value = pyramid.view(100.0, 101.0)
+    assert np.array_equal(value, trace[200000: 202000]) and time[0] == 100.0
+    time, value = pyramid.view()
+    assert len(value) <= 4000 and value.max() == trace.max() and value.min() == trace.min()
+    path = str(tmpdir.join('converted'))
+    with File(path, 'w') as output:
+        output['value'] = trace
+        output.attrs['freq'] = 2000.0
+    pyramid.save(path)
+    loaded = Pyramid.load(path)
+    assert loaded.bin_sizes == pyramid.bin_sizes and np.array_equal(loaded.view(5, 300)[1], pyramid.view(5, 300)[1])
@@ -0,0 +1,54 @@
+from os import scandir, stat, utime
+from os.path import splitext
+
+import numpy as np
+from noformat import File
+from ..reader.breath import emka
+from ..reader.motion.phenomaster import load_columns
+from ..reader.batch import KINDS, Manifest, convert_folder
+from .data.synthetic import breathing, emka_paste, phenomaster_csv
+
+
+def _small_pastes(folder):
+    """emka.find_new_files without its 25 MB minimum, so that small pastes are converted"""
+    for entry in scandir(folder):
+        if entry.is_file() and splitext(entry.name)[1] == '.txt':
+            yield entry.path, splitext(entry.path)[0]
+
+
+def _touch(file_path: str) -> None:
+    utime(file_path, ns=(0, stat(file_path).st_mtime_ns + 10 ** 9))
+
+
+def test_kinds(tmpdir, monkeypatch):
+    monkeypatch.setattr(emka, 'find_new_files', _small_pastes)
+    trace, _ = breathing(20)
+    for kind in ('emka', 'emka_scored'):
+        folder = tmpdir.mkdir(kind)
+        folder.join('101-2-20180105.txt').write(emka_paste([trace]))
+        assert convert_folder(str(folder), kind, workers=1) == [str(folder.join('101-2-20180105.txt'))]
+        result = File(str(folder.join('101-2-20180105')))
+        assert np.allclose(result['value'], trace, atol=1E-4)
+        assert ('pause_start' in result) == (kind == 'emka_scored')
+    export = tmpdir.mkdir('export')
+    export.join('20180101.csv').write(phenomaster_csv(True, 60))
+    convert_folder(str(export), 'motion', workers=1)
+    assert len(np.load(str(tmpdir.join('301001', '20180101.npz')))['XT']) == 60
+    convert_folder(str(export), 'motion_columnar', workers=1)
+    assert load_columns(str(tmpdir.join('20180101')))[3]['XT'].shape == (3, 60)
+    assert sorted(KINDS) == ['emka', 'emka_scored', 'motion', 'motion_columnar']
+
+
+def test_manifest(tmpdir, capsys):
+    export = tmpdir.mkdir('export')
+    good, bad = export.join('20180101.csv'), export.join('20180102.csv')
+    good.write(phenomaster_csv(False, 60))
+    bad.write("not an export\n")
+    assert convert_folder(str(export), 'motion_columnar', workers=2) == [str(good)]
+    assert "failed to convert {}".format(bad) in capsys.readouterr().out
+    manifest = Manifest(str(export), 'motion_columnar')
+    assert manifest.is_current(str(good)) and not manifest.is_current(str(bad))
+    assert convert_folder(str(export), 'motion_columnar', workers=2) == []
+    _touch(str(good))
+    assert convert_folder(str(export), 'motion_columnar', workers=2) == [str(good)]
+    assert convert_folder(str(export), 'motion_columnar', workers=2, force=True) == [str(good)]
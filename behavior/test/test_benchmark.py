@@ -0,0 +1,10 @@
+from . import benchmark
+
+
+def test_benchmark():
+    rows = benchmark.run([30], repeat=1, stages=['phenomaster.read', 'eAMI', 'EmkaDecoder', 'emka.line_reader'])
+    assert [row['stage'] for row in rows] == ['EmkaDecoder', 'emka.line_reader', 'phenomaster.read', 'eAMI']
+    assert all(row['peak_mb'] > 0 for row in rows)
+    assert benchmark.format_table(rows).splitlines()[0].startswith('stage')
+    assert list(benchmark.speedups(rows)) == [30]
+    assert benchmark.import_time(['json'], repeat=1) > 0
@@ -0,0 +1,55 @@
+from datetime import datetime
+from os import listdir, utime, stat
+from os.path import join
+
+import openpyxl
+import pytest
+from ..utils.cage_table import Animals
+
+
+def _make_table(file_path, rows):
+    book = openpyxl.Workbook()
+    book.active.title = 'breeders'
+    sheet = book.create_sheet('nonbreeders')
+    sheet.append(['id', 'gender', 'strain', '', 'room', 'exist', 'mouse 1', 'type 1'] + [''] * 8 +
+                 ['DOB', 'parent', 'number'])
+    for row in rows:
+        sheet.append(row)
+    book.save(file_path)
+
+
+def test_animals(tmpdir, monkeypatch):
+    file_path, cache_folder = join(str(tmpdir), 'mice.xlsx'), join(str(tmpdir), 'cache')
+    _make_table(file_path, [[101, '♂', 'mecp2', None, 3, '✓', 1, 2, 2, 1] + [None] * 6 + [datetime(2018, 1, 5), 'A12'],
+                            [None], [102, '♀', 'mecp2', None, 3, '✗', 5, None]])
+    animals = Animals.load(file_path, cache_folder)
+    assert animals[101]['DOB'] == datetime(2018, 1, 5) and animals[101][2] == 1 and animals[101]['parent'] == 'A12'
+    assert animals[102][5] == 0 and animals[102]['exist'] == 'no' and animals.animal_index == {1: 101, 2: 101, 5: 102}
+    assert Animals.load(file_path, cache_folder) is animals
+    assert Animals(file_path).data is not animals.data
+
+    Animals._loaded.clear()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("snapshot not used")
+    monkeypatch.setattr(openpyxl, 'load_workbook', fail)
+    assert Animals.load(file_path, cache_folder)[101]['DOB'] == datetime(2018, 1, 5)
+    monkeypatch.undo()
+
+    _make_table(file_path, [[101, '♂', 'mecp2', None, 3, '✓', 7, 2]])
+    utime(file_path, ns=(stat(file_path).st_atime_ns, stat(file_path).st_mtime_ns + 10 ** 9))
+    assert list(Animals.load(file_path, cache_folder)) == [(7, 2)]
+    with pytest.raises(KeyError):
+        Animals.load(file_path, None)[102]
+
+    Animals._loaded.clear()
+    snapshot = join(cache_folder, listdir(cache_folder)[0])
+    for stale in (b'\x80\x04cbehavior.utils.cage_table\nRemovedCage\n.', b'\x80\x04cno_such_module\nCage\n.',
+                  b'\x80\x04K\x01.', b'garbage'):  # pickles of an older version, or broken
+        with open(snapshot, 'wb') as fp:
+            fp.write(stale)
+        Animals._loaded.clear()
+        assert list(Animals.load(file_path, cache_folder)) == [(7, 2)]
+    Animals._loaded.clear()
+    monkeypatch.setattr(openpyxl, 'load_workbook', fail)
+    assert list(Animals.load(file_path, cache_folder)) == [(7, 2)]
@@ -0,0 +1,133 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from noformat import File
+from ..time_series.eami import eAMI, eAMI_batch, pause_count
+from ..time_series.cohort import pause_table, failures
+from ..time_series import cache as cache_module
+from ..time_series.cache import DiskCache, cached_eami, cached_pause_count
+from ..time_series.stream import StreamingEAMI, RunTracker, eAMI_stream
+from ..time_series.algorithm import find_runs
+from ..time_series.pipeline import convert_and_score, find_pauses, threaded, decode_chunks
+from ..reader.breath.recording import Recording
+from .data.synthetic import breathing, emka_paste, write_emka_paste
+
+
+def test_eami_batch():
+    traces = np.vstack([breathing(10, seed=seed)[0] for seed in range(3)])
+    batch = eAMI_batch(traces)
+    assert batch.shape == traces.shape
+    for trace, result in zip(traces, batch):
+        assert np.allclose(result, eAMI(trace))
+    assert np.allclose(eAMI_batch(traces.T, axis=0), batch.T)
+    ragged = eAMI_batch([traces[0], traces[1][0: 15000]])
+    assert len(ragged[1]) == 15000 and np.allclose(ragged[0], batch[0])
+
+
+def test_streaming_eami():
+    trace = breathing(15)[0]
+    whole = StreamingEAMI().process(trace)
+    scorer = StreamingEAMI()
+    chunked = np.hstack([scorer.process(chunk) for chunk in np.array_split(trace, 37)])
+    assert np.allclose(chunked, whole)
+    assert np.allclose(np.hstack(list(eAMI_stream(np.array_split(trace, 5)))), whole)
+
+
+def test_pause_table(tmpdir):
+    paths = list()
+    for idx in range(3):
+        path = str(tmpdir.join('1-{}-20180101'.format(idx)))
+        with File(path, 'w') as output:
+            output['value'] = breathing(10, seed=idx)[0]
+            output.attrs['freq'] = 2000.0
+        paths.append(path)
+    table = pd.DataFrame({28: [paths[0], paths[1], np.nan], 42: [paths[2], str(tmpdir.join('missing')), np.nan],
+                          'grouping': ['wt', 'wt', 'ko']},
+                         index=pd.MultiIndex.from_tuples([(1, 0), (1, 1), (1, 2)], names=('cage_id', 'animal_id')))
+    result = pause_table(table, workers=2)
+    assert result.shape == table.shape and list(result['grouping']) == ['wt', 'wt', 'ko']
+    assert result.loc[(1, 0), 28] == pause_count(File(paths[0]))
+    assert isinstance(result.loc[(1, 1), 42], IOError) and np.isnan(result.loc[(1, 2), 28])
+    assert failures(result).values.sum() == 1
+
+
+def test_disk_cache(tmpdir, monkeypatch):
+    path = str(tmpdir.join('1-0-20180101'))
+    with File(path, 'w') as output:
+        output['value'] = breathing(10)[0]
+        output.attrs['freq'] = 2000.0
+    cache = DiskCache(str(tmpdir.join('cache')))
+    first = cached_eami(path, cache=cache)
+    assert np.allclose(first, eAMI(File(path)['value'])) and cache.size > 0
+    assert np.array_equal(cached_eami(path, cache=cache), first)
+    count = cached_pause_count(path, cache=cache)
+    assert count == cached_pause_count(path, cache=cache) == pause_count(File(path))
+    cache.invalidate(path, eAMI)
+    assert len(list(cache._entries())) == 1
+    entry = next(cache._entries()).path
+    with open(entry, 'wb') as corrupt:  # an entry cut short by a crash
+        corrupt.write(b'PK\x03\x04')
+    assert cached_pause_count(path, cache=cache) == count
+    assert np.load(entry)['result'] == count
+    monkeypatch.setattr(cache_module, 'CACHE_VERSION', cache_module.CACHE_VERSION + 1)
+    cached_pause_count(path, cache=cache)
+    assert len(list(cache._entries())) == 2
+    cache.size_limit = 0
+    cache.evict()
+    assert cache.size == 0
+
+
+def test_run_tracker():
+    rng = np.random.RandomState(5)
+    for _ in range(50):
+        trace = rng.rand(rng.randint(1, 300))
+        on, min_length, max_gap = rng.rand(), rng.randint(1, 8), rng.randint(0, 8)
+        tracker = RunTracker(on, on * 0.8, min_length, max_gap)
+        runs = [tracker.process(chunk) for chunk in np.split(trace, np.sort(rng.randint(0, len(trace), 3)))]
+        runs.append(tracker.close())
+        expected = find_runs(trace, on, on * 0.8, min_length, max_gap)
+        assert np.array_equal(np.concatenate([x[0] for x in runs]), expected[0])
+        assert np.array_equal(np.concatenate([x[1] for x in runs]), expected[1])
+
+
+def test_convert_and_score(tmpdir):
+    trace = breathing(30, seed=3)[0]
+    for start in (15000, 40000):
+        trace[start: start + 4000] = np.random.RandomState(start).randn(4000) * 0.01
+    source, target = str(tmpdir.join('paste.txt')), str(tmpdir.join('101-2-20180105'))
+    with open(source, 'w') as fp:
+        fp.write(emka_paste([trace]))
+    assert convert_and_score(source, target, eami_thresh=0.3, length_thresh=2000, maxsize=2) == 2
+    result = File(target)
+    value = Recording(target)['value']
+    assert np.allclose(value, trace, atol=1E-5)
+    scores = eAMI_stream(np.array_split(np.asarray(value), 7))
+    expected = find_pauses(scores, eami_thresh=0.3, length_thresh=2000)
+    assert np.array_equal(result['pause_start'], expected[0]) and result.attrs['pauses']['count'] == 2
+    assert np.all(np.abs(result['pause_start'] - [15000, 40000]) < 2000)
+
+
+def test_pipeline_cancel(tmpdir):
+    cleaned = list()
+
+    def endless():
+        try:
+            while True:
+                yield np.zeros(10)
+        finally:
+            cleaned.append(True)
+    stage = threaded(endless(), maxsize=1)
+    next(stage)
+    stage.close()
+    assert cleaned == [True] and threading.active_count() == 1
+
+    trace, _ = breathing(250)
+    source, target = str(tmpdir.join('paste.txt')), str(tmpdir.join('converted'))
+    write_emka_paste(source, [trace])
+    chunks = decode_chunks(source, target, maxsize=1)
+    first = next(chunks)
+    chunks.close()
+    assert threading.active_count() == 1
+    value = np.load(str(tmpdir.join('converted', 'value.npy')))
+    assert np.array_equal(value[0: len(first)], first)
@@ -0,0 +1,136 @@
+from io import BytesIO, StringIO
+from os.path import join
+import threading
+import time
+
+import numpy as np
+from ..reader.breath.emka import (EmkaDecoder, NpyWriter, convert_file, read_segments, load_segment,
+                                  load_time_range)
+from ..reader.breath.recording import Recording
+from ..utils import ingest
+from ..utils.ingest import ingest_text, run
+from .data.synthetic import breathing, emka_paste
+
+
+def test_stream_decode(tmpdir):
+    values = np.sin(np.arange(5000) / 100.0)
+    paste = emka_paste([values[0: 3000], values[3000:]])
+    expected = EmkaDecoder(paste.split('\n')).data
+    assert len(expected) == 5000
+    assert np.allclose(expected, values, atol=1E-5)
+    streamed = EmkaDecoder.from_file(StringIO(paste), chunk_size=997)
+    assert np.array_equal(streamed.data, expected)
+    assert streamed.start_time == EmkaDecoder(paste.split('\n')).start_time
+    file_path = join(str(tmpdir), 'value.npy')
+    with NpyWriter(file_path) as sink:
+        EmkaDecoder.from_file(StringIO(paste), sink, chunk_size=4096)
+    assert np.array_equal(np.load(file_path), expected)
+    assert np.array_equal(EmkaDecoder.from_file(BytesIO(paste.encode()), chunk_size=997).data, expected)
+
+
+def test_bulk_parse_matches_line_reader():
+    values = np.random.RandomState(0).randn(3000) * 20
+    lines = emka_paste([values]).split('\n')
+    for idx, odd in zip(range(100, 900, 50), ["00:00:00.000\t nan", "00:00:00.000\t1-2", "short", "",
+                                               "00:00:00.000\t1.5e-3", "00:00:00.000\t-0.0", "00:00:00.000\tabc",
+                                               "00:00:00.000\t  +12  ", "00:00:00.000\t.", "   \t  ",
+                                               "00:00:00.000\t- 5", "00:00:00.000\t 5. ", "00:00:00.000\t+.5",
+                                               "00:00:00.000\t1.2.3", "00:00:00.000\t 1 2", "00:00:00.000\t--1"]):
+        lines.insert(idx, odd)
+    expected = EmkaDecoder([])
+    expected.feed_lines(lines)
+    result = EmkaDecoder(lines).data
+    assert np.array_equal(result, expected.data, equal_nan=True)
+    assert np.array_equal(np.signbit(result), np.signbit(expected.data))
+
+
+def test_segments_line_by_line():
+    values = np.arange(5000) / 1000.0
+    paste = emka_paste([values[0: 3000], values[3000:]])
+    expected = EmkaDecoder.from_file(StringIO(paste))
+    decoder = EmkaDecoder([])
+    decoder.feed(paste.replace('Flow', 'Fl\u00f6w'))  # not ascii, both segments go through the line readers
+    assert decoder.segments == expected.segments and [x[1] for x in decoder.segments] == [3000, 2000]
+    assert np.array_equal(decoder.data, expected.data)
+
+
+def test_segment_index(tmpdir):
+    values = np.arange(5000) / 1000.0
+    paste = emka_paste([values[0: 3000], values[3000:]], gap=58.5)  # blocks start 60 s apart
+    source, target = join(str(tmpdir), 'paste.txt'), join(str(tmpdir), 'converted')
+    with open(source, 'w') as fp:
+        fp.write(paste)
+    convert_file(source, target)
+    (offset0, length0, start0), (offset1, length1, start1) = read_segments(target)
+    assert (offset0, length0, offset1, length1) == (0, 3000, 3000, 2000)
+    assert start1 - start0 == 60.0
+    start, segment = load_segment(target, 1)
+    assert start == start1 and np.allclose(segment, values[3000:])
+    pieces = load_time_range(target, start0 + 1.0, start1 + 0.5)
+    assert [len(x) for _, x in pieces] == [1000, 1000]
+    assert pieces[1][0] == start1 and np.allclose(pieces[0][1], values[2000: 3000])
+
+
+def test_recording(tmpdir):
+    values = np.arange(5000) / 1000.0
+    paste = emka_paste([values[0: 3000], values[3000:]])
+    source, target = join(str(tmpdir), 'paste.txt'), join(str(tmpdir), 'converted')
+    with open(source, 'w') as fp:
+        fp.write(paste)
+    convert_file(source, target)
+    recording = Recording(target)
+    assert isinstance(recording['value'], np.memmap) and recording.duration == 2.5
+    window = recording[1.0: 2.0]
+    assert np.allclose(window['value'], values[2000: 4000]) and window.offset == 1.0
+    assert [x[0: 2] for x in window.segments] == [(0, 1000), (1000, 1000)]
+    assert window.start == recording.start + 1.0 and window.segment(1).start == recording.segments[1][2]
+    assert len(recording[2.0:]) == 1000 and len(recording[3.0: 4.0]) == 0
+    assert [len(x) for x in recording.chunks(1.0, 0.25)] == [2000, 2500, 1500]
+    assert [len(x) for x in window.between(recording.start, recording.start + 0.75)] == []
+
+
+def test_ingest(tmpdir):
+    values = np.arange(3000) / 1000.0
+    paste = emka_paste([values])
+    drop, target = tmpdir.mkdir('drop'), tmpdir.mkdir('converted')
+    assert ingest_text(paste, str(target)) == str(target.join('101-2-20180105'))
+    assert ingest_text("no header", str(target)) is None
+    drop.join('early.txt').write(paste.replace('101-2', '101-3'))
+    for poll in (True, False):
+        stop = threading.Event()
+        worker = threading.Thread(target=run, args=(str(drop), str(target)),
+                                  kwargs={'interval': 0.05, 'stop': stop, 'poll': poll})
+        worker.start()
+        drop.join('late.txt').write(paste.replace('101-2', '101-4' if poll else '101-5'))
+        deadline = time.time() + 10.0
+        while len(drop.listdir()) > 0 and time.time() < deadline:
+            time.sleep(0.05)
+        stop.set()
+        worker.join()
+    assert sorted(x.basename for x in target.listdir()) == ['101-{}-20180105'.format(x) for x in range(2, 6)]
+    assert np.allclose(Recording(str(target.join('101-5-20180105')))['value'], values)
+
+
+def test_ingest_reported_twice(tmpdir, monkeypatch, capsys):
+    paste = emka_paste([np.arange(3000) / 1000.0])
+    drop, target = tmpdir.mkdir('drop'), tmpdir.mkdir('converted')
+    for name, case in (('first.txt', '101-2'), ('same_case.txt', '101-2'), ('removed.txt', '101-3')):
+        drop.join(name).write(paste.replace('101-2', case))
+    for keep, names in ((True, ['first.txt', 'first.txt', 'same_case.txt']), (False, ['removed.txt'] * 2)):
+        monkeypatch.setattr(ingest, 'watch', lambda *args: iter([str(drop.join(x)) for x in names]))
+        run(str(drop), str(target), keep=keep)
+    output = capsys.readouterr().out
+    assert 'failed' not in output and output.count('saved file') == 2
+    assert "skipped {}, already converted to {}".format(drop.join('same_case.txt'),
+                                                        target.join('101-2-20180105')) in output
+    assert sorted(x.basename for x in target.listdir()) == ['101-2-20180105', '101-3-20180105']
+    assert sorted(x.basename for x in drop.listdir()) == ['first.txt', 'same_case.txt']
+
+
+def test_synthetic_paste():
+    trace, apneas = breathing(40, apneas=3, seed=2)
+    assert len(apneas) == 3 and all(np.abs(trace[start: start + length]).max() < 0.2 for start, length in apneas)
+    decoder = EmkaDecoder.from_file(StringIO(emka_paste(np.array_split(trace, 3), gap=30.0)), chunk_size=1 << 16)
+    assert np.allclose(decoder.data, trace, atol=1E-5)
+    starts = [start for _, _, start in decoder.segments]
+    assert np.allclose(np.diff(starts), 30.0 + 40 / 3, atol=1E-3)
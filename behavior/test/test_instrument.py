@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from io import StringIO
+from os.path import dirname
+
+import numpy as np
+from ..utils import instrument
+from ..utils.instrument import profiling, stage
+from ..time_series.eami import eAMI
+from ..time_series.main import get_t_in_out
+from ..reader.breath.emka import EmkaDecoder
+from .data.synthetic import breathing, emka_paste
+
+
+def test_profiling(tmpdir):
+    trace, _ = breathing(30)
+    json_path = str(tmpdir.join('profile.json'))
+    assert not instrument.enabled()
+    with profiling(json_path) as profile:
+        eAMI(trace)
+        get_t_in_out(trace)
+        EmkaDecoder.from_file(StringIO(emka_paste([trace[0: 10000]])))
+        with stage('outer') as frame:
+            with stage('inner'):
+                buffer = np.ones(1 << 20)
+            frame.samples = buffer.size
+
+        def work():
+            with stage('worker'):
+                np.ones(1 << 10)
+        worker = threading.Thread(target=work)
+        worker.start()
+        worker.join()
+    assert not instrument.enabled()
+    totals = profile.totals()
+    assert totals['eAMI']['calls'] == 1 and totals['eAMI']['samples'] == len(trace)
+    assert totals['eAMI.filtfilt']['calls'] == 6 and totals['get_t_in_out.smooth']['samples'] == 2 * len(trace)
+    assert totals['emka.decode']['samples'] == 10000
+    assert totals['outer']['samples'] == 1 << 20 and totals['outer']['peak_mb'] >= totals['inner']['peak_mb'] >= 7.9
+    assert totals['eAMI']['seconds'] >= totals['eAMI.filtfilt']['seconds']
+    assert totals['worker']['calls'] == 1 and totals['worker']['peak_mb'] is None
+    assert json.load(open(json_path))['totals']['eAMI']['calls'] == 1
+    assert profile.summary().splitlines()[0].startswith('stage')
+    with stage('ignored'):
+        pass
+    assert 'ignored' not in profile.totals()
+
+
+def test_environment_switch(tmpdir):
+    json_path = str(tmpdir.join('profile-{pid}.json'))
+    script = "import numpy as np; from behavior.time_series import eAMI; eAMI(np.random.randn(20000))"
+    env = dict(os.environ, BEHAVIOR_PROFILE=json_path)
+    subprocess.run([sys.executable, '-c', script], check=True, env=env, cwd=dirname(dirname(dirname(__file__))))
+    saved = tmpdir.listdir(lambda x: x.basename.startswith('profile-'))
+    assert len(saved) == 1 and json.load(saved[0].open())['totals']['eAMI']['samples'] == 20000
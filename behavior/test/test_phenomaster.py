@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+from noformat import File
+import pytest
+from ..reader.motion.phenomaster import read, read_columns, _read_times, convert_columnar, load_columns
+from .data.synthetic import CAGES, phenomaster_csv
+from ..time_series.locomotion import analyze, analyze_exp, summarize
+
+
+def test_read_times():
+    minutes = _read_times(np.array(["23:58", "23:59", "0:00", " 12:30", "23:59", "    00:01 "]))
+    assert np.array_equal(minutes, [1438, 1439, 1440, 2190, 2879, 2881])
+    for bad in (np.nan, "", "12:3", "1230", "12:30:00", "24:00", "12:60", "a1:30", "12::3", "12:300000", "12:3é"):
+        with pytest.raises(ValueError):
+            _read_times(np.array(["12:29", bad], dtype=object))
+
+
+def test_read():
+    for long_form in (True, False):
+        data = read(phenomaster_csv(long_form, 3000, CAGES))
+        assert list(data) == [animal for _, animal in CAGES]
+        for animal in data.values():
+            assert np.array_equal(animal['time'], np.arange(1000, 4000))
+            assert all(len(animal[x]) == 3000 for x in ('XT', 'XA', 'XF'))
+    long_data, wide_data = read(phenomaster_csv(True, 3000, CAGES)), read(phenomaster_csv(False, 3000, CAGES))
+    for key in ('XT', 'XA', 'XF'):
+        assert np.array_equal(long_data['601001'][key], wide_data['601001'][key])
+    night = long_data['301001']['XT'][(np.arange(1000, 4000) // 60 % 24 >= 19)]
+    assert night.mean() > long_data['301001']['XT'].mean()
+
+
+def test_columnar_store(tmpdir):
+    export_folder = tmpdir.mkdir('export')
+    export_folder.join('20180101.csv').write(phenomaster_csv(True, 3000))
+    convert_columnar(str(export_folder.join('20180101.csv')))
+    animal_ids, cage_ids, time, channels = load_columns(str(tmpdir.join('20180101')))
+    data = read(phenomaster_csv(True, 3000))
+    assert animal_ids == list(data) and cage_ids == [cage for cage, _ in CAGES[0: 3]]
+    assert np.array_equal(time, data['301001']['time'])
+    assert isinstance(channels['XA'], np.memmap) and channels['XA'].shape == (3, 3000)
+    assert np.array_equal(channels['XF'][1], data['401002']['XF'])
+    assert File(str(tmpdir.join('20180101'))).attrs['id'] == [301001, 401002, 601001]
+    lines = phenomaster_csv(True, 10, CAGES[0: 2]).split('\n')
+    with pytest.raises(ValueError):
+        read_columns('\n'.join(lines[0: -4] + lines[-3:]))  # second animal misses its last sample
+
+
+def test_locomotion(tmpdir):
+    export_folder = tmpdir.mkdir('export')
+    export_folder.join('20180101.csv').write(phenomaster_csv(True, 2880, CAGES))
+    convert_columnar(str(export_folder.join('20180101.csv')))
+    target = str(tmpdir.join('20180101'))
+    result = analyze(target)
+    assert list(result.index) == [(301, 1), (401, 2), (601, 1), (701, 3), (901, 2)]
+    data = read(phenomaster_csv(True, 2880, CAGES))
+    frame = pd.DataFrame({'time': data['401002']['time'], 'count': data['401002']['XT']})
+    frame['light'] = (frame['time'] % 1440 >= 420) & (frame['time'] % 1440 < 1140)
+    means = frame.groupby('light')['count'].mean()
+    row = result.loc[(401, 2)]
+    assert np.isclose(row['light_mean'], means[True]) and np.isclose(row['dark_mean'], means[False])
+    hourly = frame.groupby(frame['time'] % 1440 // 60)['count'].mean()
+    assert np.allclose(row[['h{:04.1f}'.format(x) for x in range(24)]].astype(float), hourly)
+    assert row['dark_light_ratio'] > 2.0 and row['rests'] == 0 and row['bouts'] == 1
+
+    counts = np.zeros((1, 60))
+    counts[0, [3, 4, 5, 7, 30, 31]] = 5
+    stats = summarize([(1, 1)], np.arange(600, 660), counts, bout_max_gap=2, rest_min_length=5).iloc[0]
+    assert stats['bouts'] == 2 and stats['bout_minutes'] == 3.5 and np.isclose(stats['bout_intensity'], 30 / 7)
+    assert stats['rests'] == 2 and stats['longest_rest_minutes'] == 28.0 and np.isnan(stats['dark_mean'])
+
+    exp = pd.DataFrame({28: [target, np.nan], 42: [target, target]},
+                       index=pd.MultiIndex.from_tuples([(401, 2), (601, 1)], names=('cage_id', 'animal_id')))
+    table = analyze_exp(exp)
+    assert list(table.index) == [(401, 2, 28), (401, 2, 42), (601, 1, 42)]
+    assert table.loc[(401, 2, 42), 'total'] == data['401002']['XT'].sum()
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from os import utime, stat
+
+import numpy as np
+import pandas as pd
+from noformat import File
+from ..utils.cage_table import Animals, Cage
+from ..utils.result_table import _find_exp_file, _approximate
+from ..utils.file_index import FileIndex
+
+
+def _reference(index, cage_info, ids, dates, tolerance=4):
+    result = pd.DataFrame(columns=dates, index=index)
+    for case_id in ids:
+        if case_id not in index:
+            continue
+        for exp_date, case_path in ids[case_id]:
+            exp_day = _approximate((exp_date - cage_info[case_id[0]]['DOB']).days, dates, tolerance)
+            if exp_day is not None:
+                result.loc[case_id, exp_day] = case_path
+    return result
+
+
+def _cohort(cage_no, seed):
+    rng = np.random.RandomState(seed)
+    cages = [Cage({1: 1, 2: 2}, {'id': cage_id, 'DOB': datetime(2018, 1, 1) + timedelta(days=int(rng.randint(60)))})
+             for cage_id in range(cage_no)]
+    ids = dict()
+    for cage in cages:
+        for animal_id in (1, 2, 3):
+            ids[(cage['id'], animal_id)] = [(cage['DOB'] + timedelta(days=int(day), hours=int(rng.randint(24))),
+                                             '{}-{}-{}'.format(cage['id'], animal_id, idx))
+                                            for idx, day in enumerate(rng.randint(20, 70, 4))]
+    index = pd.MultiIndex.from_tuples([(cage['id'], animal_id) for cage in cages for animal_id in (1, 2)],
+                                      names=('cage_id', 'animal_id'))
+    return index, Animals(cages=cages), ids
+
+
+def test_find_exp_file():
+    index, animals, ids = _cohort(40, 3)
+    for dates, tolerance in [([28, 42, 56], 4), ([28, 42, 56], 10), ([30, 35], 3), ([], 4)]:
+        expected = _reference(index, animals, ids, dates, tolerance)
+        result = _find_exp_file(index, animals, ids, dates, tolerance)
+        pd.testing.assert_frame_equal(result, expected)
+    index, animals, ids = _cohort(2000, 4)
+    result = _find_exp_file(index, animals, ids, [28, 42, 56])
+    assert result.notna().values.sum() > 1000
+
+
+def test_file_index(tmpdir):
+    data_folder = tmpdir.mkdir('emka')
+    for name in ['101-1-20180205', '101-2-20180205-b', 'notes']:
+        with File(str(data_folder.join(name)), 'w') as output:
+            output['value'] = np.zeros(3)
+            output.attrs['freq'] = 2000.0
+    data_folder.join('102-1-20180205.txt').write('')
+    index = FileIndex(str(tmpdir.join('index.sqlite')))
+    ids = index.ids(str(data_folder), 'emka')
+    assert ids == {(101, 1): [(datetime(2018, 2, 5), str(data_folder.join('101-1-20180205')))],
+                   (101, 2): [(datetime(2018, 2, 5), str(data_folder.join('101-2-20180205-b')))]}
+    assert index.update(str(data_folder), 'emka') == 0
+    with File(str(data_folder.join('101-1-20180219')), 'w') as output:
+        output.attrs['freq'] = 2000.0
+    data_folder.join('notes').remove()
+    utime(str(data_folder), ns=(0, stat(str(data_folder)).st_mtime_ns + 10 ** 9))
+    assert index.update(str(data_folder), 'emka') == 1
+    assert [x[0].day for x in index.ids(str(data_folder), 'emka')[(101, 1)]] == [5, 19]
+    assert index.update(str(data_folder), 'emka', force=True) == 4
+    data_folder.mkdir('101-1-20180305')  # being converted, no attributes.json yet
+    utime(str(data_folder), ns=(0, stat(str(data_folder)).st_mtime_ns + 10 ** 9))
+    assert index.update(str(data_folder), 'emka') == 1 and (101, 1) in index.ids(str(data_folder), 'emka')
+    assert len(index.ids(str(data_folder), 'emka')[(101, 1)]) == 2
+    with File(str(data_folder.join('101-1-20180305')), 'w') as output:
+        output.attrs['freq'] = 2000.0
+    assert [x[0].day for x in index.ids(str(data_folder), 'emka')[(101, 1)]] == [5, 19, 5]
+    assert index.update(str(data_folder), 'emka') == 0
+
+    pheno_folder = tmpdir.mkdir('pheno')
+    with File(str(pheno_folder.join('20180205')), 'w') as output:
+        output.attrs['id'] = [101001, 101002]
+    with File(str(pheno_folder.join('20180206')), 'w') as output:
+        output.attrs['animal_id'] = ['m1', 'm2']  # named animals, no numeric ids
+    pheno_folder.mkdir('20180207')  # being synced
+    assert sorted(index.ids(str(pheno_folder), 'pheno')) == [(101, 1), (101, 2)]
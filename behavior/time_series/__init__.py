@@ -1,4 +1,6 @@
-from .eami import eAMI, visualize_eami, pause_count
-from .algorithm import boolean2index
+from .eami import eAMI, eAMI_batch, visualize_eami, pause_count
+from .algorithm import boolean2index, find_runs
+from .stream import StreamingEAMI, RunTracker, eAMI_stream
 
-__all__ = ['eAMI', 'visualize_eami', 'pause_count', 'boolean2index']
+__all__ = ['eAMI', 'eAMI_batch', 'visualize_eami', 'pause_count', 'boolean2index', 'find_runs', 'StreamingEAMI', 'RunTracker',
+           'eAMI_stream']
@@ -0,0 +1,152 @@
+"""on disk memoization of the breath metrics, keyed by source file identity and parameters"""
+from typing import Callable, Dict, Optional, Any, Tuple, Union
+from hashlib import sha1
+import json
+import shutil
+from zipfile import BadZipFile
+from os import makedirs, replace, remove, stat, utime, scandir, getpid
+from os.path import abspath, expanduser, join, isdir
+
+import numpy as np
+
+from .eami import eAMI, pause_count
+from ..reader.breath.recording import Recording
+
+CACHE_FOLDER = "~/.cache/behavior"
+SIZE_LIMIT = 2 << 30  # bytes
+CACHE_VERSION = 1  # bump when a cached function changes its results, orphaning the old entries
+_RESULT = 'result'
+
+
+def _hash(value: Any) -> str:
+    return sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()[0: 16]
+
+
+def _to_arrays(result: Any) -> Dict[str, np.ndarray]:
+    if isinstance(result, tuple):
+        return {'{}_{}'.format(_RESULT, idx): np.asarray(value) for idx, value in enumerate(result)}
+    return {_RESULT: np.asarray(result)}
+
+
+def _from_arrays(arrays: Dict[str, np.ndarray]) -> Any:
+    if _RESULT in arrays:
+        value = arrays[_RESULT]
+        return value[()] if value.ndim == 0 else value
+    return tuple(arrays['{}_{}'.format(_RESULT, idx)] for idx in range(len(arrays)))
+
+
+def _identity(file_path: str) -> Tuple[int, int]:
+    """(size, mtime) of a file, summed size and latest mtime over the items of a noformat folder"""
+    if not isdir(file_path):
+        file_stat = stat(file_path)
+        return file_stat.st_size, file_stat.st_mtime_ns
+    stats = [entry.stat() for entry in scandir(file_path) if entry.is_file()]
+    return sum(x.st_size for x in stats), max([x.st_mtime_ns for x in stats] + [stat(file_path).st_mtime_ns])
+
+
+class DiskCache(object):
+    """results stored as uncompressed npz files, one folder per source file so a file can be invalidated
+    as a whole. Entries are evicted least recently used first when the folder outgrows size_limit.
+    Changing a source file changes its (size, mtime) and so its keys, stale entries age out."""
+    def __init__(self, folder: str = CACHE_FOLDER, size_limit: int = SIZE_LIMIT) -> None:
+        self.folder = expanduser(folder)
+        self.size_limit = size_limit
+
+    def _source_folder(self, file_path: str) -> str:
+        return join(self.folder, _hash(abspath(file_path)))
+
+    def _entry(self, func: Callable, file_path: str, params: Dict[str, Any]) -> str:
+        identity = [CACHE_VERSION, func.__module__, _identity(file_path), params]
+        return join(self._source_folder(file_path), '{}-{}.npz'.format(func.__name__, _hash(identity)))
+
+    def call(self, func: Callable, file_path: str, loader: Callable[[str], Any], **params) -> Any:
+        """func(loader(file_path), **params), loaded from the cache when possible. Unreadable entries,
+        e.g. truncated by a crash, are removed and recomputed."""
+        entry = self._entry(func, file_path, params)
+        try:
+            with np.load(entry) as arrays:
+                result = _from_arrays(dict(arrays))
+            utime(entry)  # mark as recently used
+            return result
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, BadZipFile, ValueError, KeyError):
+            try:
+                remove(entry)
+            except FileNotFoundError:  # removed by another process
+                pass
+        result = func(loader(file_path), **params)
+        makedirs(self._source_folder(file_path), exist_ok=True)
+        temp_path = '{}.{}.tmp.npz'.format(entry[0: -4], getpid())
+        np.savez(temp_path, **_to_arrays(result))
+        replace(temp_path, entry)
+        self.evict()
+        return result
+
+    def _entries(self):
+        if not isdir(self.folder):
+            return
+        for source in scandir(self.folder):
+            if source.is_dir():
+                for entry in scandir(source.path):
+                    if entry.name.endswith('.npz') and '.tmp.' not in entry.name:
+                        yield entry
+
+    @property
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self) -> None:
+        """remove least recently used entries until the cache fits in size_limit"""
+        entries = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._entries()),
+                         reverse=True)
+        total = 0
+        for _, size, path in entries:
+            total += size
+            if total > self.size_limit:
+                try:
+                    remove(path)
+                except FileNotFoundError:  # evicted by another process
+                    pass
+
+    def invalidate(self, file_path: Optional[str] = None, func: Optional[Callable] = None) -> None:
+        """drop cached results, of one source file and/or one function, or everything"""
+        if file_path is None and func is None:
+            shutil.rmtree(self.folder, ignore_errors=True)
+            return
+        folders = [self._source_folder(file_path)] if file_path is not None else \
+            [entry.path for entry in scandir(self.folder) if entry.is_dir()] if isdir(self.folder) else []
+        for folder in folders:
+            if func is None:
+                shutil.rmtree(folder, ignore_errors=True)
+            elif isdir(folder):
+                for entry in scandir(folder):
+                    if entry.name.startswith(func.__name__ + '-'):
+                        remove(entry.path)
+
+
+default_cache = DiskCache()
+
+
+def _load_value(file_path: str) -> np.ndarray:
+    return Recording(file_path).value
+
+
+def cached_eami(file_path: str, freq_range: Tuple[float, float] = (2.0, 20.0),
+                cache: Optional[DiskCache] = None) -> np.ndarray:
+    """eAMI of the trace in a converted emka file, see eAMI"""
+    return (cache or default_cache).call(eAMI, file_path, _load_value, freq_range=tuple(freq_range))
+
+
+def cached_t_in_out(file_path: str, freq: float = 2000.0, tails: float = 0.05,
+                    cache: Optional[DiskCache] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """t_in and t_out of the trace in a converted emka file, see get_t_in_out"""
+    from .main import get_t_in_out
+    return (cache or default_cache).call(get_t_in_out, file_path, _load_value, freq=freq, tails=tails)
+
+
+def cached_pause_count(file_path: str, eami_thresh: float = 0.5, length_thresh: int = 600,
+                       cache: Optional[DiskCache] = None) -> Union[int, np.int64]:
+    """pause count of a converted emka file, see pause_count"""
+    return (cache or default_cache).call(pause_count, file_path, Recording, eami_thresh=eami_thresh,
+                                         length_thresh=length_thresh)
@@ -0,0 +1,69 @@
+"""run analyses over a whole experiment table (from behavior.utils.result_table) on a process pool"""
+from typing import Callable, Any, Optional, Sequence, Hashable
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import cpu_count
+
+import pandas as pd
+from noformat import File
+
+from .eami import pause_count
+
+
+def _pause_count_file(file_path: str, eami_thresh: float, length_thresh: int) -> int:
+    return int(pause_count(File(file_path), eami_thresh, length_thresh))
+
+
+def _safe_call(func: Callable[[str], Any], file_path: str) -> Any:
+    try:
+        return func(file_path)
+    except Exception as e:  # recorded in the cell, the rest of the table still runs
+        return e
+
+
+def map_table(table: pd.DataFrame, func: Callable[[str], Any], columns: Optional[Sequence[Hashable]] = None,
+              workers: Optional[int] = None) -> pd.DataFrame:
+    """apply func to the file path in every filled cell of an experiment table, one file per worker.
+    Args:
+        table: from exp_table, breath_exp or motion_exp, cells are file paths or NaN
+        func: takes a file path, must be picklable (a module level function or a partial of one)
+        columns: columns holding file paths, defaults to all columns not named by a str, i.e. the
+            experiment days, other columns (grouping, genotype) are copied
+        workers: worker processes, defaults to the number of cpus
+    Returns:
+        table of the same shape, with func's result in each filled cell. If func raised on a file the
+        cell holds the exception instead.
+    """
+    if columns is None:
+        columns = [col for col in table.columns if not isinstance(col, str)]
+    result = table.copy()
+    cells = [(row, col, table.iat[row, table.columns.get_loc(col)]) for col in columns for row in range(len(table))]
+    cells = [(row, col, path) for row, col, path in cells if isinstance(path, str)]
+    for col in columns:
+        result[col] = result[col].astype(object)
+    if not cells:
+        return result
+    with ProcessPoolExecutor(max_workers=min(workers or cpu_count() or 1, len(cells))) as pool:
+        outputs = pool.map(partial(_safe_call, func), [path for _, _, path in cells])
+        for (row, col, _), output in zip(cells, outputs):
+            result.iat[row, result.columns.get_loc(col)] = output
+    return result
+
+
+def pause_table(table: pd.DataFrame, eami_thresh: float = 0.5, length_thresh: int = 600,
+                workers: Optional[int] = None) -> pd.DataFrame:
+    """pause_count for every recording in an experiment table such as breath_exp(), see map_table
+    Args:
+        table: experiment table with paths to converted emka files
+        eami_thresh, length_thresh: see pause_count
+        workers: worker processes, defaults to the number of cpus
+    Returns:
+        table of the same shape with pause counts, exceptions for files that failed
+    """
+    return map_table(table, partial(_pause_count_file, eami_thresh=eami_thresh, length_thresh=length_thresh),
+                     workers=workers)
+
+
+def failures(table: pd.DataFrame) -> pd.DataFrame:
+    """boolean mask of the cells of a map_table result that hold an exception"""
+    return table.apply(lambda col: col.map(lambda x: isinstance(x, Exception)))
@@ -1,17 +1,20 @@
 from collections.abc import MutableMapping
-from typing import Sequence, Tuple, Union, List
+from functools import lru_cache
+from typing import Sequence, Tuple, Union, List, Optional, TYPE_CHECKING
 
 import numpy as np
 from scipy.signal import filtfilt, butter
-from matplotlib import pyplot as plt
-from matplotlib.figure import Figure
-import seaborn as sns
-sns.set()
 
-from .algorithm import boolean2index
+from .algorithm import find_runs
+from .pyramid import Pyramid
+from ..utils.instrument import instrumented, stage
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
 FILTER_ORDER = 1
 SAMPLE_FREQ = 2000  # for emka whole body plethysmograph
+CUTOFF_LEVELS = [0.90309, 2.30103, 0.75]
 Rangef = Tuple[float, float]
 
 
@@ -19,38 +22,89 @@ def _get_filter_cutoff(ratio: Union[float, np.ndarray, List[float]], freq_range:
     return np.exp(np.sum(np.log(freq_range) * np.vstack([ratio, np.subtract(1, ratio)]).T, 1))
 
 
-def _apply(x: np.ndarray, cutoff: Union[Sequence[float], float], filter_type: str) -> np.ndarray:
-    return filtfilt(*butter(FILTER_ORDER, np.divide(cutoff, SAMPLE_FREQ), filter_type), x)
+@lru_cache(maxsize=64)
+def _design(cutoff: Union[Tuple[float, ...], float], filter_type: str,
+            sample_freq: float) -> Tuple[np.ndarray, np.ndarray]:
+    return butter(FILTER_ORDER, np.divide(cutoff, sample_freq), filter_type)
+
+
+def _filter(cutoff: Union[Sequence[float], float], filter_type: str,
+            sample_freq: float = SAMPLE_FREQ) -> Tuple[np.ndarray, np.ndarray]:
+    cutoff = tuple(map(float, cutoff)) if np.ndim(cutoff) else float(cutoff)  # hashable for the cache
+    return _design(cutoff, filter_type, sample_freq)
+
 
+def _apply(x: np.ndarray, cutoff: Union[Sequence[float], float], filter_type: str, axis: int = -1) -> np.ndarray:
+    with stage('eAMI.filtfilt', np.size(x)):
+        return filtfilt(*_filter(cutoff, filter_type), x, axis=axis)
 
-def _energy(x: np.ndarray, band: Rangef) -> np.ndarray:
-    return np.abs(_apply(_apply(x, band[0], 'highpass') ** 2, band[1], 'lowpass'))
+
+def _energy(x: np.ndarray, band: Rangef, axis: int = -1) -> np.ndarray:
+    return np.abs(_apply(_apply(x, band[0], 'highpass', axis) ** 2, band[1], 'lowpass', axis))
 
 
 # noinspection PyPep8Naming
-def eAMI(trace: np.ndarray, freq_range: Rangef = (2.0, 20.0)) -> np.ndarray:
-    CUTOFF_LEVELS = [0.90309, 2.30103, 0.75]
+@instrumented('eAMI')
+def eAMI(trace: np.ndarray, freq_range: Rangef = (2.0, 20.0), axis: int = -1) -> np.ndarray:
     ENVELOP_CUTOFF, *BAND_CUTOFF = _get_filter_cutoff(CUTOFF_LEVELS, freq_range)
-    signal = _apply(trace, freq_range, 'bandpass')
-    envelope = _apply(np.abs(signal), ENVELOP_CUTOFF, 'lowpass')
-    result = _energy(envelope, BAND_CUTOFF) / _energy(signal, BAND_CUTOFF)  # type: np.ndarray
+    signal = _apply(trace, freq_range, 'bandpass', axis)
+    envelope = _apply(np.abs(signal), ENVELOP_CUTOFF, 'lowpass', axis)
+    result = _energy(envelope, BAND_CUTOFF, axis) / _energy(signal, BAND_CUTOFF, axis)  # type: np.ndarray
     return result
 
 
-def visualize_eami(x, threshold=0.3, duration_threshold=1000) -> Figure:
+# noinspection PyPep8Naming
+def eAMI_batch(traces: Union[np.ndarray, Sequence[np.ndarray]], freq_range: Rangef = (2.0, 20.0),
+               axis: int = -1) -> Union[np.ndarray, List[np.ndarray]]:
+    """eAMI of many traces at once, each filter is designed once and reused.
+    Args:
+        traces: either an n-D array filtered along axis, or a list of 1-D traces of any length
+        freq_range: see eAMI
+        axis: time axis of an array input
+    Returns:
+        same shape as traces, a list for list input
+    """
+    if isinstance(traces, np.ndarray):
+        return eAMI(traces, freq_range, axis)
+    return [eAMI(np.asarray(trace), freq_range) for trace in traces]
+
+
+def visualize_eami(x, threshold=0.3, duration_threshold=1000, trace_pyramid: Optional[Pyramid] = None) -> "Figure":
+    """plot trace, eAMI score and detected pauses. Lines are drawn from min/max pyramids and redrawn at
+    the resolution of the current view when zooming, so multi-hour traces stay responsive.
+    Args:
+        x: raw trace
+        threshold: eAMI threshold for pauses
+        duration_threshold: pauses not longer than this in samples are not shown
+        trace_pyramid: pyramid of x, e.g. Pyramid.load from the converted file, built when not given
+    """
+    from matplotlib import pyplot as plt
+    import seaborn as sns
+    sns.set()
     result = eAMI(x, freq_range=(2, 20))
-    time = np.arange(len(x)) / 2000
+    offset = np.mean(x)
+    raw_pyramid = trace_pyramid or Pyramid.build(x, SAMPLE_FREQ)
+    eami_pyramid = Pyramid.build(np.minimum(result, 2.0), SAMPLE_FREQ)
     fig, ax = plt.subplots()
-    raw = ax.plot(time, x - x.mean(), 'b')[0]
-    eami = ax.plot(time, np.minimum(result, 2.0), 'g')[0]
-    threshold_line = ax.plot((0, len(x) / 2000), [threshold] * 2, 'r')[0]
-    triggered = np.zeros(len(x))
-    idx, duration = boolean2index(result > threshold)
-    idx = idx[duration > duration_threshold]
-    duration = duration[duration > duration_threshold]
-    for start, end in zip(idx, idx + duration):
-        triggered[start: end] = min(threshold * 1.5, 1.0)
-    pauses = ax.plot(time, triggered, 'cyan')[0]
+    raw = ax.plot([], [], 'b')[0]
+    eami = ax.plot([], [], 'g')[0]
+    threshold_line = ax.plot((0, len(x) / SAMPLE_FREQ), [threshold] * 2, 'r')[0]
+    idx, duration = find_runs(result, threshold, min_length=duration_threshold + 1)
+    pauses = ax.hlines(np.full(len(idx), min(threshold * 1.5, 1.0)), idx / SAMPLE_FREQ,
+                       (idx + duration) / SAMPLE_FREQ, colors='cyan')
+
+    def redraw(axes):
+        start, end = axes.get_xlim()
+        time, value = raw_pyramid.view(start, end)
+        raw.set_data(time, value - offset)
+        eami.set_data(*eami_pyramid.view(start, end))
+        fig.canvas.draw_idle()
+
+    ax.set_xlim(0, len(x) / SAMPLE_FREQ)
+    redraw(ax)
+    ax.relim()
+    ax.autoscale_view(scalex=False)
+    ax.callbacks.connect('xlim_changed', redraw)
     ax.set_xlabel('time (s)')
     ax.set_ylabel('air flow / eami score (a.u.)')
     ax.legend([raw, eami, threshold_line, pauses], ["raw traces", "eAMI score", "threshold", "detected pauses"])
@@ -58,14 +112,17 @@ def visualize_eami(x, threshold=0.3, duration_threshold=1000) -> Figure:
     return fig
 
 
-def pause_count(data: MutableMapping, eami_thresh: int = 0.5, length_thresh: int = 600) -> np.int64:
+def pause_count(data: MutableMapping, eami_thresh: int = 0.5, length_thresh: int = 600,
+                eami_off_thresh: Optional[float] = None, max_gap: int = 0) -> np.int64:
     """calcualte breath pause frequency with eAMI.
     Args:
         data: a 1-D DataFrame with raw breath trace
         eami_thresh: threshold of eami value for abnormality detection
         length_thresh: threshold in ms for pause, pauses shorter then this are not counted
+        eami_off_thresh: a pause lasts until eami drops to this value, defaults to eami_thresh
+        max_gap: pauses interrupted for fewer samples than this count as one
     Returns:
         integer for pause connt
     """
-    _, length = boolean2index(eAMI(data['value']) > eami_thresh)
-    return np.count_nonzero(np.greater(length, length_thresh))
+    start, _ = find_runs(eAMI(data['value']), eami_thresh, eami_off_thresh, length_thresh + 1, max_gap)
+    return np.int64(len(start))
@@ -0,0 +1,141 @@
+"""locomotion statistics of phenomaster exports: light/dark activity, circadian profiles, activity bouts
+and rest periods for all animals of an export at once, from the columnar store of convert_columnar"""
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .algorithm import find_runs
+from ..reader.motion.phenomaster import load_columns
+from ..utils.instrument import instrumented
+
+LIGHTS_ON = 7 * 60  # minute of the day
+LIGHTS_OFF = 19 * 60
+DAY = 1440  # minutes
+CaseId = Tuple[int, Union[int, str]]
+
+
+def case_ids(animal_ids: Sequence[str], cage_ids: Sequence[int]) -> List[CaseId]:
+    """(cage_id, animal_id) as in motion_exp, numeric ids hold cage * 1000 + animal"""
+    return [(int(x) // 1000, int(x) % 1000) if x.isdigit() else (cage, x) for x, cage in zip(animal_ids, cage_ids)]
+
+
+def light_phase(time: np.ndarray, lights_on: int = LIGHTS_ON, lights_off: int = LIGHTS_OFF) -> np.ndarray:
+    """True for minutes (since midnight of the first day) with lights on"""
+    minute = np.asarray(time) % DAY
+    return (minute >= lights_on) & (minute < lights_off)
+
+
+def _sample_minutes(time: np.ndarray) -> float:
+    return float(np.median(np.diff(time))) if len(time) > 1 else 1.0
+
+
+def circadian(counts: np.ndarray, time: np.ndarray, bin_minutes: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """mean counts per sample in each bin of the day, pooled over days
+    Args:
+        counts: [animal, time] counts
+        time: minutes since midnight of the first day
+        bin_minutes: bin width, a divisor of 1440
+    Returns:
+        bin starts in hours of the day, [animal, bin] means, nan for bins without samples
+    """
+    bin_no = DAY // bin_minutes
+    index = (np.asarray(time) % DAY // bin_minutes).astype(np.intp)
+    sums = np.zeros((bin_no, counts.shape[0]))
+    np.add.at(sums, index, np.asarray(counts, dtype=np.float64).T)
+    samples = np.bincount(index, minlength=bin_no)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (sums / samples[:, np.newaxis]).T
+    return np.arange(bin_no) * bin_minutes / 60.0, means
+
+
+def _run_sums(cumulative: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    return cumulative[starts + lengths] - cumulative[starts]
+
+
+def _animal_stats(row: np.ndarray, light: np.ndarray, step: float, bout_threshold: float, bout_min_length: int,
+                  bout_max_gap: int, rest_threshold: float, rest_min_length: int) -> Dict[str, float]:
+    cumulative = np.concatenate([[0.0], np.cumsum(row, dtype=np.float64)])
+    starts, lengths = find_runs(row, bout_threshold, min_length=bout_min_length, max_gap=bout_max_gap)
+    bout_counts = _run_sums(cumulative, starts, lengths)
+    rest_starts, rest_lengths = find_runs(row <= rest_threshold, 0.5, min_length=rest_min_length)
+    edges = np.zeros(len(row) + 1, np.int64)
+    np.add.at(edges, rest_starts, 1)
+    np.add.at(edges, rest_starts + rest_lengths, -1)
+    resting = np.cumsum(edges[0: -1]) > 0
+    hours = len(row) * step / 60.0
+    return {
+        'bouts': len(starts), 'bouts_per_hour': len(starts) / hours if hours else np.nan,
+        'bout_minutes': lengths.mean() * step if len(starts) else np.nan,
+        'bout_intensity': bout_counts.sum() / lengths.sum() if len(starts) else np.nan,
+        'bout_dark_fraction': (~light[starts]).mean() if len(starts) else np.nan,
+        'rests': len(rest_starts),
+        'rest_minutes': rest_lengths.mean() * step if len(rest_starts) else np.nan,
+        'longest_rest_minutes': rest_lengths.max() * step if len(rest_starts) else 0.0,
+        'rest_light_fraction': resting[light].mean() if light.any() else np.nan,
+        'rest_dark_fraction': resting[~light].mean() if (~light).any() else np.nan}
+
+
+def summarize(ids: Sequence[CaseId], time: np.ndarray, counts: np.ndarray, lights_on: int = LIGHTS_ON,
+              lights_off: int = LIGHTS_OFF, bin_minutes: int = 60, bout_threshold: float = 0,
+              bout_min_length: int = 1, bout_max_gap: int = 2, rest_threshold: float = 0,
+              rest_min_length: int = 5) -> pd.DataFrame:
+    """locomotion statistics of several animals recorded on one time axis
+    Args:
+        ids: (cage_id, animal_id) of each row of counts
+        time: minutes since midnight of the first day, as read by phenomaster
+        counts: [animal, time] beam breaks
+        lights_on, lights_off: minute of the day the lights switch
+        bin_minutes: width of the circadian bins
+        bout_threshold: a bout is a run of samples with counts above this
+        bout_min_length: shortest bout in samples
+        bout_max_gap: bouts separated by fewer samples than this are merged
+        rest_threshold: a rest period is a run of samples with counts at or below this
+        rest_min_length: shortest rest period in samples
+    Returns:
+        one row per animal indexed by (cage_id, animal_id): mean counts per sample in light and dark,
+        their ratio, bout and rest statistics (durations in minutes) and the circadian profile in
+        columns named by the bin start hour, e.g. 'h07.0'
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    light = light_phase(time, lights_on, lights_off)
+    step = _sample_minutes(time)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        light_mean = counts[:, light].mean(1) if light.any() else np.full(len(counts), np.nan)
+        dark_mean = counts[:, ~light].mean(1) if (~light).any() else np.full(len(counts), np.nan)
+        ratio = dark_mean / light_mean
+    table = pd.DataFrame({'total': counts.sum(1), 'light_mean': light_mean, 'dark_mean': dark_mean,
+                          'dark_light_ratio': ratio})
+    stats = pd.DataFrame([_animal_stats(row, light, step, bout_threshold, bout_min_length, bout_max_gap,
+                                        rest_threshold, rest_min_length) for row in counts])
+    hours, profile = circadian(counts, time, bin_minutes)
+    profile = pd.DataFrame(profile, columns=['h{:04.1f}'.format(x) for x in hours])
+    result = pd.concat([table, stats, profile], axis=1)
+    result.index = pd.MultiIndex.from_tuples(list(ids), names=('cage_id', 'animal_id'))
+    return result
+
+
+@instrumented('locomotion.analyze')
+def analyze(file_name: str, channel: str = 'XT', **params) -> pd.DataFrame:
+    """summarize one export converted by phenomaster.convert_columnar, see summarize for params"""
+    animal_ids, cage_ids, time, channels = load_columns(file_name)
+    return summarize(case_ids(animal_ids, cage_ids), time, channels[channel], **params)
+
+
+def analyze_exp(exp: pd.DataFrame, channel: str = 'XT', **params) -> pd.DataFrame:
+    """summarize every recording listed in a motion_exp() table, each export read once
+    Returns:
+        one row per case and experiment day, indexed by (cage_id, animal_id, day)
+    """
+    days = [column for column in exp.columns if isinstance(column, (int, np.integer))]
+    exports = dict()  # type: Dict[str, pd.DataFrame]
+    rows = list()
+    for day in days:
+        for case_id, file_name in exp[day].dropna().items():
+            if file_name not in exports:
+                exports[file_name] = analyze(file_name, channel, **params)
+            if case_id in exports[file_name].index:
+                rows.append(exports[file_name].loc[[case_id]].assign(day=day))
+    if not rows:
+        return pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=('cage_id', 'animal_id', 'day')))
+    return pd.concat(rows).set_index('day', append=True)
@@ -1,10 +1,13 @@
 """algorithms for processing 1d time series data"""
-from typing import Tuple
+from typing import Tuple, Callable
 
 import numpy as np
-from algorithm.filter.gaussian import apply_gaussian
+from numba import njit
 from scipy.signal import argrelextrema
 
+from .algorithm import recursive_gaussian, push
+from ..utils.instrument import instrumented, stage
+
 _EXTREMA_ORDER = 100
 _LOW_FILTER = 1.0
 _HIGH_FILTER = 0.025
@@ -27,8 +30,78 @@ def old_peak_valley(trace):
     return max_index, argmin
 
 
-def get_t_in_out(trace: np.ndarray, freq: float = 2000.0,
-                 tails: float = 0.05) -> Tuple[np.ndarray, np.ndarray]:
+def _crossings(trace: np.ndarray, freq: float,
+               smooth: Callable[[np.ndarray, int], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """rising and falling baseline crossings as sample index into trace, paired so that
+    rising[i] < falling[i] < rising[i + 1]"""
+    padding = int(_PADDING * freq)
+    with stage('get_t_in_out.smooth', np.size(trace) * 2):
+        slow = smooth(trace, int(freq * _LOW_FILTER))
+        fast = smooth(trace, int(freq * _HIGH_FILTER))
+    # trace = trace[padding: -padding]
+    normalized = (fast - slow)[padding: -padding]
+    rising = next(iter(np.nonzero(np.logical_and(normalized[1:] > 0, normalized[0:-1] <= 0))))
+    falling = next(iter(np.nonzero(np.logical_and(normalized[1:] <= 0, normalized[0:-1] > 0))))
+    rising = rising[0: np.searchsorted(rising, falling[-1])]
+    falling = falling[np.searchsorted(falling, rising[0]):]
+    return rising + padding, falling + padding
+
+
+@njit(cache=True)
+def _extrema(trace: np.ndarray, delta: float) -> Tuple[np.ndarray, np.ndarray]:
+    """alternating valleys and peaks in one pass, starting with a valley. An extremum only counts once
+    the trace has moved delta away from it, so every peak stands at least delta above both neighbouring
+    valleys and noise smaller than delta cannot split a breath."""
+    valleys = np.empty(64, np.int64)
+    peaks = np.empty(64, np.int64)
+    valley_no, peak_no = 0, 0
+    low, high = np.inf, -np.inf
+    low_idx, high_idx = 0, 0
+    rising = False
+    for idx in range(len(trace)):
+        value = trace[idx]
+        if value > high:
+            high, high_idx = value, idx
+        if value < low:
+            low, low_idx = value, idx
+        if rising and value < high - delta:
+            peaks = push(peaks, peak_no, high_idx)
+            peak_no += 1
+            low, low_idx, rising = value, idx, False
+        elif not rising and value > low + delta:
+            valleys = push(valleys, valley_no, low_idx)
+            valley_no += 1
+            high, high_idx, rising = value, idx, True
+    return valleys[0: valley_no], peaks[0: peak_no]
+
+
+BREATH_DTYPE = np.dtype([('onset', 'i8'), ('peak', 'i8'), ('offset', 'i8'), ('amplitude', 'f8'),
+                         ('duration', 'f8')])
+
+
+def peak_valley(trace: np.ndarray, freq: float = 2000.0, min_amplitude: float = 0.2) -> np.ndarray:
+    """segment a respiration trace into breaths in a single O(N) pass, replaces old_peak_valley
+    Args:
+        trace: respiration trace, smooth it first if it is noisy (see algorithm.recursive_gaussian)
+        freq: sampling frequency of the plethysmograph
+        min_amplitude: hysteresis in trace units, a peak has to rise this much above both valleys
+    Returns:
+        structured array with one row per breath (BREATH_DTYPE): onset valley, peak and offset valley as
+        sample index, amplitude of the peak over the mean of its valleys, duration in seconds
+    """
+    valleys, peaks = _extrema(np.asarray(trace, dtype=np.float64), min_amplitude)
+    breath_no = max(min(len(peaks), len(valleys) - 1), 0)
+    result = np.zeros(breath_no, dtype=BREATH_DTYPE)
+    result['onset'], result['peak'], result['offset'] = valleys[0: breath_no], peaks[0: breath_no], \
+        valleys[1: breath_no + 1]
+    result['amplitude'] = trace[result['peak']] - (trace[result['onset']] + trace[result['offset']]) / 2.0
+    result['duration'] = (result['offset'] - result['onset']) / freq
+    return result
+
+
+@instrumented('get_t_in_out')
+def get_t_in_out(trace: np.ndarray, freq: float = 2000.0, tails: float = 0.05,
+                 smooth: Callable[[np.ndarray, int], np.ndarray] = recursive_gaussian) -> Tuple[np.ndarray, np.ndarray]:
     """get t_in and t_out as the time of inspiration and expiration in seconds. t_in is the time
     between dropping below baseline and rising above baseline. t_out is the time between rising
     above baseline and dropping again below the baseline.
@@ -36,18 +109,12 @@ def get_t_in_out(trace: np.ndarray, freq: float = 2000.0,
         trace: full respiration trace
         freq: sampling frequency of the plethysmograph
         tails: the proportion of extreme values to discard at each tail
+        smooth: smooth(trace, sigma in samples), the recursive gaussian costs the same for the 1 s
+            baseline as for the 25 ms trace, algorithm.filter.gaussian.apply_gaussian convolves
     Returns:
         t_in, t_out
     """
-    padding = int(_PADDING * freq)
-    slow = apply_gaussian(trace, int(freq * _LOW_FILTER))
-    fast = apply_gaussian(trace, int(freq * _HIGH_FILTER))
-    # trace = trace[padding: -padding]
-    normalized = (fast - slow)[padding: -padding]
-    rising = next(iter(np.nonzero(np.logical_and(normalized[1:] > 0, normalized[0:-1] <= 0))))
-    falling = next(iter(np.nonzero(np.logical_and(normalized[1:] <= 0, normalized[0:-1] > 0))))
-    rising = rising[0: np.searchsorted(rising, falling[-1])]
-    falling = falling[np.searchsorted(falling, rising[0]):]
+    rising, falling = _crossings(trace, freq, smooth)
     t_in = np.sort(rising[1:] - falling[0:-1])
     t_out = np.sort(falling - rising)
     t_in = t_in[int(len(t_in) * tails): int(len(t_in) * (1 - tails))]
@@ -57,5 +124,48 @@ def get_t_in_out(trace: np.ndarray, freq: float = 2000.0,
     return t_in / freq, t_out / freq
 
 
+def _trimmed_mean(x: np.ndarray, tails: float) -> float:
+    """mean of x without the tails, same cut as get_t_in_out but by partial selection instead of a sort"""
+    low, high = int(len(x) * tails), int(len(x) * (1 - tails))
+    if high <= low:
+        return np.nan
+    return np.partition(x, [low, high - 1])[low: high].mean()
+
+
+WINDOW_DTYPE = np.dtype([('start', 'f8'), ('t_in', 'f8'), ('t_out', 'f8'), ('n_in', 'i8'), ('n_out', 'i8')])
+
+
+def get_t_in_out_windowed(trace: np.ndarray, freq: float = 2000.0, window: float = 30.0, step: float = 15.0,
+                          tails: float = 0.05,
+                          smooth: Callable[[np.ndarray, int], np.ndarray] = recursive_gaussian) -> np.ndarray:
+    """t_in and t_out over time. Smoothing and crossing detection run once over the whole trace, each
+    window then only selects the breaths that start in it.
+    Args:
+        trace: full respiration trace
+        freq: sampling frequency of the plethysmograph
+        window: window length in seconds
+        step: seconds between window starts, windows overlap when step < window
+        tails: the proportion of extreme values to discard at each tail in each window
+        smooth: see get_t_in_out
+    Returns:
+        structured array with one row per window (WINDOW_DTYPE): start time (s), trimmed mean t_in and
+        t_out (s) and the number of inspirations and expirations in the window
+    """
+    rising, falling = _crossings(trace, freq, smooth)
+    t_in, t_out = (rising[1:] - falling[0:-1]) / freq, (falling - rising) / freq
+    starts = np.arange(0, max(len(trace) / freq - window, 0) + step / 2, step)
+    result = np.zeros(len(starts), dtype=WINDOW_DTYPE)
+    result['start'] = starts
+    bounds = np.round(np.vstack([starts, starts + window]) * freq).astype(np.int64)
+    in_first, in_last = np.searchsorted(falling[0:-1], bounds)
+    out_first, out_last = np.searchsorted(rising, bounds)
+    for idx in range(len(starts)):
+        result['t_in'][idx] = _trimmed_mean(t_in[in_first[idx]: in_last[idx]], tails)
+        result['t_out'][idx] = _trimmed_mean(t_out[out_first[idx]: out_last[idx]], tails)
+    result['n_in'] = in_last - in_first
+    result['n_out'] = out_last - out_first
+    return result
+
+
 def get_log_ratio(a, b, x):
     return (np.log(x) - np.log(b)) / (np.log(a) - np.log(b))
@@ -0,0 +1,125 @@
+"""convert and score emka pastes in one pass: decoding, eAMI and pause detection run as threaded stages
+over chunks of samples, connected by bounded queues"""
+from typing import Iterable, Iterator, Optional, Tuple
+from contextlib import closing
+from queue import Full, Queue
+import threading
+
+import numpy as np
+from noformat import File
+
+from .stream import RunTracker, eAMI_stream
+from .eami import SAMPLE_FREQ, Rangef
+
+QUEUE_SIZE = 8  # chunks held between two stages before the upstream one waits
+_POLL = 0.1  # s between checks for cancellation while a stage waits on a full queue
+_DONE = object()
+
+
+class _Failure(object):
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+class _Cancelled(Exception):
+    """the consuming stage stopped reading"""
+
+
+def _put(queue: Queue, item, stop: threading.Event) -> None:
+    while True:
+        try:
+            queue.put(item, timeout=_POLL)
+            return
+        except Full:
+            if stop.is_set():
+                raise _Cancelled()
+
+
+def _put_all(items: Iterable, queue: Queue, stop: threading.Event) -> None:
+    try:
+        for item in items:
+            _put(queue, item, stop)
+        _put(queue, _DONE, stop)
+    except _Cancelled:
+        pass
+    except BaseException as error:  # handed over to the consuming stage
+        try:
+            _put(queue, _Failure(error), stop)
+        except _Cancelled:
+            pass
+    finally:
+        if hasattr(items, 'close'):  # let upstream stages stop and clean up
+            items.close()
+
+
+def _drain(queue: Queue, stop: threading.Event, thread: threading.Thread) -> Iterator:
+    """items put in queue by another stage until it is done, re-raising its errors here. When this
+    generator is closed early the producing stage is cancelled and joined."""
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def threaded(items: Iterable, maxsize: int = QUEUE_SIZE) -> Iterator:
+    """run a generator stage in its own thread, at most maxsize items ahead of its consumer"""
+    queue, stop = Queue(maxsize), threading.Event()  # type: Queue, threading.Event
+    return _drain(queue, stop, threading.Thread(target=_put_all, args=(items, queue, stop), daemon=True))
+
+
+def decode_chunks(file_name: str, target_name: str, maxsize: int = QUEUE_SIZE) -> Iterator[np.ndarray]:
+    """convert a paste file to target_name like emka.convert_file, yielding the samples of each decoded
+    chunk as they are written. Decoding runs in a thread and waits while maxsize chunks are unread. If
+    reading stops early the conversion is abandoned, with its files closed."""
+    from ..reader.breath.emka import convert_stream
+    queue, stop = Queue(maxsize), threading.Event()  # type: Queue, threading.Event
+
+    def convert() -> Iterator[None]:
+        with open(file_name, 'rb') as source:
+            convert_stream(source, target_name, tap=lambda values: _put(queue, np.array(values, np.float32), stop))
+        yield from ()
+
+    return _drain(queue, stop, threading.Thread(target=_put_all, args=(convert(), queue, stop), daemon=True))
+
+
+def find_pauses(scores: Iterable[np.ndarray], eami_thresh: float = 0.5, length_thresh: int = 600,
+                eami_off_thresh: Optional[float] = None, max_gap: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """pauses in a stream of eAMI chunks, with the thresholds of pause_count
+    Returns:
+        start and length of each pause in samples
+    """
+    tracker = RunTracker(eami_thresh, eami_off_thresh, length_thresh + 1, max_gap)
+    runs = [tracker.process(chunk) for chunk in scores]
+    runs.append(tracker.close())
+    return np.concatenate([x[0] for x in runs]), np.concatenate([x[1] for x in runs])
+
+
+def convert_and_score(file_name: str, target_name: str, freq_range: Rangef = (2.0, 20.0),
+                      eami_thresh: float = 0.5, length_thresh: int = 600, eami_off_thresh: Optional[float] = None,
+                      max_gap: int = 0, maxsize: int = QUEUE_SIZE) -> int:
+    """convert a paste file and detect pauses in one pass over it. The pauses are stored in the
+    converted file as pause_start and pause_length (in samples), the count and parameters in
+    attrs['pauses']. Scores come from StreamingEAMI, so they are causal and differ from the offline
+    eAMI used by pause_count, see StreamingEAMI.
+    Returns:
+        number of pauses
+    """
+    scores = threaded(eAMI_stream(decode_chunks(file_name, target_name, maxsize), freq_range, SAMPLE_FREQ),
+                      maxsize)
+    with closing(scores):
+        starts, lengths = find_pauses(scores, eami_thresh, length_thresh, eami_off_thresh, max_gap)
+    with File(target_name, 'r+') as output:
+        output['pause_start'] = starts
+        output['pause_length'] = lengths
+        output.attrs['pauses'] = {'count': len(starts), 'method': 'streaming', 'freq_range': list(freq_range),
+                                  'eami_thresh': eami_thresh, 'length_thresh': length_thresh,
+                                  'eami_off_thresh': eami_off_thresh, 'max_gap': max_gap}
+    return len(starts)
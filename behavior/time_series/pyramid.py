@@ -0,0 +1,77 @@
+"""min/max decimation pyramid for drawing long traces at the resolution of the current view"""
+from typing import List, Optional, Tuple
+from os.path import join
+
+import numpy as np
+from noformat import File
+
+BASE_BIN = 16  # samples per bin at the finest level
+FACTOR = 4  # bins merged from one level to the next
+MAX_POINTS = 4000  # points per line that a view is allowed to draw
+
+
+def _decimate(x: np.ndarray, bin_size: int) -> np.ndarray:
+    """[bins, 2] array of min and max over consecutive bins, the last bin may be short"""
+    full = len(x) // bin_size * bin_size
+    blocks = np.asarray(x[0: full]).reshape(-1, bin_size)
+    result = np.column_stack([blocks.min(1), blocks.max(1)])
+    if full < len(x):
+        tail = np.asarray(x[full:])
+        result = np.vstack([result, [[tail.min(), tail.max()]]])
+    return result
+
+
+class Pyramid(object):
+    """min/max of a trace over bins of bin_sizes[k] samples at level k, each level FACTOR times coarser.
+    Views finer than the finest level read the raw trace, which can be a memory mapped array."""
+    def __init__(self, levels: List[np.ndarray], bin_sizes: List[int], length: int, freq: float,
+                 raw: Optional[np.ndarray] = None) -> None:
+        self.levels = levels
+        self.bin_sizes = bin_sizes
+        self.length = length
+        self.freq = freq
+        self.raw = raw
+
+    @classmethod
+    def build(cls, x: np.ndarray, freq: float = 2000.0, base: int = BASE_BIN, factor: int = FACTOR,
+              max_points: int = MAX_POINTS) -> "Pyramid":
+        """decimate x until a level fits in max_points, O(N) in total"""
+        levels, bin_sizes = [_decimate(x, base)], [base]
+        while len(levels[-1]) * 2 > max_points:
+            levels.append(np.column_stack([_decimate(levels[-1][:, 0], factor)[:, 0],
+                                           _decimate(levels[-1][:, 1], factor)[:, 1]]))
+            bin_sizes.append(bin_sizes[-1] * factor)
+        return cls(levels, bin_sizes, len(x), freq, x)
+
+    def view(self, start: float = 0.0, end: Optional[float] = None,
+             max_points: int = MAX_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+        """time (s) and values to draw between start and end (s), at the finest resolution that fits in
+        max_points. Binned levels give min and max of each bin in turn, so peaks survive decimation."""
+        first = max(int(start * self.freq), 0)
+        last = self.length if end is None else min(int(np.ceil(end * self.freq)), self.length)
+        if last <= first:
+            return np.zeros(0), np.zeros(0)
+        if self.raw is not None and last - first <= max_points:
+            return np.arange(first, last) / self.freq, np.asarray(self.raw[first: last])
+        for bin_size, level in zip(self.bin_sizes, self.levels):
+            if (last - first) // bin_size * 2 <= max_points or level is self.levels[-1]:
+                break
+        low, high = first // bin_size, -(-last // bin_size)
+        time = (np.arange(low, high) + 0.5) * bin_size / self.freq
+        return np.repeat(time, 2), level[low: high].ravel()
+
+    def save(self, file_name: str, name: str = 'value') -> None:
+        """store the levels in a noformat file, next to the trace they were built from"""
+        with File(file_name, 'r+') as output:
+            for idx, level in enumerate(self.levels):
+                output['{}_lod{}'.format(name, idx)] = level
+            output.attrs['{}_lod_bins'.format(name)] = self.bin_sizes
+
+    @classmethod
+    def load(cls, file_name: str, name: str = 'value') -> "Pyramid":
+        """levels stored with save, the raw trace is memory mapped"""
+        data = File(file_name)
+        bin_sizes = data.attrs['{}_lod_bins'.format(name)]
+        levels = [data['{}_lod{}'.format(name, idx)] for idx in range(len(bin_sizes))]
+        raw = np.load(join(file_name, name + '.npy'), mmap_mode='r')
+        return cls(levels, bin_sizes, len(raw), data.attrs.get('freq', 2000.0), raw)
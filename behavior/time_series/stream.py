@@ -0,0 +1,95 @@
+"""causal eAMI over consecutive chunks of a trace, for files too long to hold in memory and for live
+acquisition"""
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy.signal import lfilter, lfilter_zi
+
+from .eami import _filter, _get_filter_cutoff, CUTOFF_LEVELS, SAMPLE_FREQ, Rangef
+from .algorithm import _track_runs
+
+
+class _CausalFilter(object):
+    """causal counterpart of filtfilt: the filter is run forward twice instead of forward and backward.
+    The magnitude response is the same, the phase is not zero."""
+    def __init__(self, cutoff: Union[Sequence[float], float], filter_type: str, sample_freq: float) -> None:
+        self.b, self.a = _filter(cutoff, filter_type, sample_freq)
+        self._state: Optional[List[np.ndarray]] = None
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        if self._state is None:  # start in steady state for the first sample, like filtfilt's padding
+            level, zi, self._state = x[0], lfilter_zi(self.b, self.a), list()
+            for _ in range(2):
+                self._state.append(zi * level)
+                level = level * np.sum(self.b) / np.sum(self.a)
+        for idx in range(2):
+            x, self._state[idx] = lfilter(self.b, self.a, x, zi=self._state[idx])
+        return x
+
+
+class StreamingEAMI(object):
+    """eAMI computed chunk by chunk with IIR filter state carried between chunks. Memory does not
+    depend on trace length and every chunk is scored as soon as it arrives, the latency is the chunk
+    length. Chunk size does not change the result.
+
+    Differences from the offline eAMI: each filtfilt stage becomes two causal passes of the same filter,
+    so magnitude responses are identical but no stage is zero phase any more, and the filters start from
+    a steady state instead of filtfilt's edge padding. On a synthetic 2 kHz breathing trace with injected
+    pauses (freq_range (2, 20)) the streamed score lags the offline one by about 0.35 s, log scores
+    correlate at about 0.6, and pauses found with thresholds of 0.3 to 0.5 start 0.2 to 0.5 s later than
+    offline; pauses scoring close to the threshold can be found by only one of the two. The first
+    second after start is dominated by the filters settling. Use the offline eAMI where results have to
+    match earlier analyses.
+    """
+    def __init__(self, freq_range: Rangef = (2.0, 20.0), sample_freq: float = SAMPLE_FREQ) -> None:
+        envelope_cutoff, *band_cutoff = _get_filter_cutoff(CUTOFF_LEVELS, freq_range)
+        self.sample_freq = sample_freq
+        self._band = _CausalFilter(freq_range, 'bandpass', sample_freq)
+        self._envelope = _CausalFilter(envelope_cutoff, 'lowpass', sample_freq)
+        self._energy_filters = [(_CausalFilter(band_cutoff[0], 'highpass', sample_freq),
+                                 _CausalFilter(band_cutoff[1], 'lowpass', sample_freq)) for _ in range(2)]
+
+    @staticmethod
+    def _energy(x: np.ndarray, highpass: _CausalFilter, lowpass: _CausalFilter) -> np.ndarray:
+        return np.abs(lowpass(highpass(x) ** 2))
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """score the next chunk of samples, returns an array of the same length"""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if len(chunk) == 0:
+            return chunk
+        signal = self._band(chunk)
+        envelope = self._envelope(np.abs(signal))
+        return self._energy(envelope, *self._energy_filters[0]) / self._energy(signal, *self._energy_filters[1])
+
+
+class RunTracker(object):
+    """find_runs over consecutive chunks of a trace, with the same result as find_runs on the whole.
+    Each run is reported from the chunk where it ends, or max_gap samples later when runs are merged."""
+    def __init__(self, on: float, off: Optional[float] = None, min_length: int = 1, max_gap: int = 0) -> None:
+        self.on, self.off = on, on if off is None else off
+        self.min_length, self.max_gap = min_length, max_gap
+        self.position = 0
+        self._state = np.full(3, -1, np.int64)
+
+    def process(self, chunk: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """runs completed up to the end of chunk, as start (in samples from the first chunk) and length"""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        result = _track_runs(chunk, self.position, self.on, self.off, self.min_length, self.max_gap,
+                             self._state, False)
+        self.position += len(chunk)
+        return result
+
+    def close(self) -> Tuple[np.ndarray, np.ndarray]:
+        """runs still open or waiting to merge at the end of the trace"""
+        return _track_runs(np.zeros(0), self.position, self.on, self.off, self.min_length, self.max_gap,
+                           self._state, True)
+
+
+# noinspection PyPep8Naming
+def eAMI_stream(chunks: Iterable[np.ndarray], freq_range: Rangef = (2.0, 20.0),
+                sample_freq: float = SAMPLE_FREQ) -> Iterator[np.ndarray]:
+    """generator version of StreamingEAMI, yields one scored chunk per input chunk"""
+    scorer = StreamingEAMI(freq_range, sample_freq)
+    for chunk in chunks:
+        yield scorer.process(chunk)
@@ -1,7 +1,13 @@
 from .cage_table import get_case
-try:
-    from .main import emka_save
-except (ValueError, ImportError):
-    emka_save = None
+
+
+def emka_save():
+    """listen to the clipboard and save emka pastes, only available on windows"""
+    try:
+        from .main import emka_save as _emka_save
+    except (AttributeError, ImportError, ValueError):  # ctypes.windll and the clipboard libraries
+        raise OSError("emka_save reads the windows clipboard and only runs on windows")
+    _emka_save()
+
 
 __all__ = ['get_case']
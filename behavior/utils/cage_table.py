@@ -1,11 +1,19 @@
 """wrap around mouse management table"""
-from typing import Dict, Tuple, Union, Callable
+from typing import Dict, Tuple, Union, Callable, Optional, Sequence, Any, TYPE_CHECKING
 from datetime import datetime
+from hashlib import sha1
+import pickle
+from os import makedirs, replace, stat, getpid
+from os.path import abspath, expanduser, join
 
-import openpyxl
-from openpyxl.cell.cell import Cell
+from .instrument import instrumented
+
+if TYPE_CHECKING:
+    from openpyxl.cell.cell import Cell
 
 FILE_PATH = "/home/palpatine/Sync/project/2016-mecp2-bumetanide/data/Mouse Management.xlsx"
+CACHE_FOLDER = "~/.cache/behavior"
+_COLUMN_NO = 19
 
 def _date_digest(data_in: Union[datetime, float]) -> datetime:
     if isinstance(data_in, datetime):
@@ -36,17 +44,23 @@ class Cage(object):  # pylint: disable=R0903
         self.number = properties.get('number', len(mouse_list))
 
     @classmethod
-    def load(cls, row: Tuple[Cell, ...]):
+    def load(cls, row: Tuple["Cell", ...]):
+        return cls.from_values([cell.value for cell in row])
+
+    @classmethod
+    def from_values(cls, row: Sequence[Any]):
+        """build from the cell values of one row, short rows are padded with empty cells"""
+        row = list(row) + [None] * (_COLUMN_NO - len(row))
         mouse_list = dict()  # type: Dict[int, int]
         for col_id in range(6, 16, 2):
-            animal_id = row[col_id].value
+            animal_id = row[col_id]
             if animal_id is None:
                 continue
-            mouse_type = row[col_id + 1].value
+            mouse_type = row[col_id + 1]
             mouse_list[int(animal_id)] = int(mouse_type) if mouse_type else 0
         params = dict()
         for key, (value, processor) in COLUMN_NAME.items():
-            value = row[value].value
+            value = row[value]
             if value is not None:
                 params[key] = processor(value)
         return cls(mouse_list, params)
@@ -72,23 +86,65 @@ class Cage(object):  # pylint: disable=R0903
 
 
 class Animals(object):
-    """manage the whole non-breeders sheet"""
-    animal_index = dict()  # type: Dict[str, str]
-    data = dict()  # type: Dict[int, Cage]
-
-    def __init__(self, file_path: str) -> None:
-        table_file = openpyxl.load_workbook(file_path)
-        sheet = table_file.get_sheet_by_name("nonbreeders")
-        rows = sheet.iter_rows()
-        next(rows)  # skip table headers
-        for row in rows:
-            if row[0].value is None:
-                continue
-            cage = Cage.load(row)
+    """manage the whole non-breeders sheet. Use Animals.load to share one parsed table between calls."""
+    _loaded = dict()  # type: Dict[str, Tuple[Tuple[int, int], Animals]]
+
+    def __init__(self, file_path: Optional[str] = None, cages: Sequence[Cage] = ()) -> None:
+        self.data = dict()  # type: Dict[int, Cage]
+        self.animal_index = dict()  # type: Dict[int, int]
+        if file_path is not None:
+            cages = self._read(file_path)
+        for cage in cages:
             cage_id = cage['id']
             self.data[cage_id] = cage
             self.animal_index.update({x: cage_id for x in cage.mouse_list})
 
+    @staticmethod
+    def _read(file_path: str):
+        import openpyxl
+        table_file = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for row in table_file["nonbreeders"].iter_rows(min_row=2, max_col=_COLUMN_NO, values_only=True):
+                if row and row[0] is not None:
+                    yield Cage.from_values(row)
+        finally:
+            table_file.close()
+
+    @classmethod
+    @instrumented('cage_table.load')
+    def load(cls, file_path: str, cache_folder: Optional[str] = CACHE_FOLDER) -> "Animals":
+        """the table in file_path, parsed once per process and kept as a pickle snapshot in cache_folder
+        (None to skip) so that later processes skip openpyxl. Both are rebuilt when the file changes, the
+        snapshot also when it cannot be unpickled."""
+        file_path = abspath(expanduser(file_path))
+        file_stat = stat(file_path)
+        identity = (file_stat.st_size, file_stat.st_mtime_ns)
+        if file_path in cls._loaded and cls._loaded[file_path][0] == identity:
+            return cls._loaded[file_path][1]
+        snapshot = None
+        if cache_folder is not None:
+            snapshot = join(expanduser(cache_folder), 'cage_table-{}.pkl'.format(
+                sha1(file_path.encode('utf-8')).hexdigest()[0: 16]))
+        animals = None
+        if snapshot is not None:
+            try:
+                with open(snapshot, 'rb') as fp:
+                    saved_identity, cages = pickle.load(fp)
+                if saved_identity == identity:
+                    animals = cls(cages=cages)
+            except (OSError, EOFError, AttributeError, ImportError, TypeError, ValueError, pickle.UnpicklingError):
+                pass  # written by another version or cut short, rebuilt below
+        if animals is None:
+            animals = cls(file_path)
+            if snapshot is not None:
+                makedirs(expanduser(cache_folder), exist_ok=True)
+                temp_path = '{}.{}'.format(snapshot, getpid())
+                with open(temp_path, 'wb') as fp:
+                    pickle.dump((identity, list(animals.data.values())), fp, pickle.HIGHEST_PROTOCOL)
+                replace(temp_path, snapshot)
+        cls._loaded[file_path] = (identity, animals)
+        return animals
+
     def __getitem__(self, case_id: int) -> Cage:
         return self.data[case_id]
 
@@ -106,6 +162,5 @@ def get_case(cage_id: int, animal_id: int) -> Tuple[datetime, int]:
     Returns:
         (birthday, genotype)
     """
-    animals = Animals(FILE_PATH)
-    cage = animals[cage_id]
+    cage = Animals.load(FILE_PATH)[cage_id]
     return cage['DOB'], cage[animal_id]  # type: ignore
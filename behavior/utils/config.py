@@ -1,7 +1,7 @@
 import json
 from typing import Callable, Union, TypeVar
-from pkg_resources import resource_stream, Requirement
-from os.path import expanduser
+from functools import lru_cache
+from os.path import expanduser, join, dirname
 T = TypeVar('T')
 
 
@@ -24,7 +24,14 @@ _FILTERS = {str: expanduser, bytes: expanduser}
 def item_filter(in_data: T) -> T:
     if type(in_data) in _FILTERS:
         return _FILTERS[type(in_data)](in_data)
+    return in_data
+
+
+CONFIG_PATH = join(dirname(__file__), 'behavior.json')
 
 
-config_stream = resource_stream(Requirement.parse('behavior'), 'behavior/utils/behavior.json')
-config = walk_dict(json.loads(config_stream.read().decode('utf-8')), item_filter)
+@lru_cache(maxsize=None)
+def get_config(section: str = 'result_table') -> dict:
+    """one section of behavior.json with user folders expanded, read on first use"""
+    with open(CONFIG_PATH, 'r') as fp:
+        return walk_dict(json.load(fp), item_filter)[section]
@@ -0,0 +1,129 @@
+"""persistent index of converted experiment files by case and date, updated from folder mtimes"""
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import defaultdict
+from contextlib import closing
+from datetime import datetime
+import sqlite3
+from os import makedirs, listdir, stat
+from os.path import abspath, dirname, expanduser, isdir, join
+
+from noformat import File, isFile
+
+INDEX_PATH = "~/.cache/behavior/file_index.sqlite"
+
+Case = Tuple[int, int, datetime]
+IDs = Dict[Tuple[int, int], List[Tuple[datetime, str]]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (folder TEXT, kind TEXT, mtime INTEGER, PRIMARY KEY (folder, kind));
+CREATE TABLE IF NOT EXISTS entries (folder TEXT, kind TEXT, name TEXT, PRIMARY KEY (folder, kind, name));
+CREATE TABLE IF NOT EXISTS cases (folder TEXT, kind TEXT, name TEXT, cage_id INTEGER, animal_id INTEGER,
+                                  date TEXT);
+CREATE INDEX IF NOT EXISTS cases_entry ON cases (folder, kind, name);
+"""
+
+
+def probe_pheno(folder: str, name: str) -> Optional[List[Case]]:
+    """phenomaster exports: one folder per day named %Y%m%d, cases in attrs['id'] as cage * 1000 + animal"""
+    try:
+        date = datetime.strptime(name, '%Y%m%d')
+    except ValueError:
+        return []
+    if not isdir(join(folder, name)):
+        return []
+    try:
+        id_nos = File(join(folder, name)).attrs.get('id', [])
+    except (OSError, ValueError):  # still being converted or synced
+        return None
+    return [(int(id_no) // 1000, int(id_no) % 1000, date) for id_no in id_nos]
+
+
+def probe_emka(folder: str, name: str) -> Optional[List[Case]]:
+    """converted emka files named cage-animal-%Y%m%d[-postfix]"""
+    try:
+        cage_id, animal_id, exp_date_str, *postfix = name.split('-')
+        case = (int(cage_id), int(animal_id), datetime.strptime(exp_date_str, '%Y%m%d'))
+    except ValueError:
+        return []
+    if not isdir(join(folder, name)):
+        return []
+    return [case] if isFile(join(folder, name)) else None  # None while still being converted or synced
+
+
+# probes give the cases of one folder entry, [] when it is not an experiment file and None when it
+# looks like one but cannot be read yet, so that it is probed again on the next update
+PROBES = {'pheno': probe_pheno, 'emka': probe_emka}  # type: Dict[str, Callable[[str, str], Optional[List[Case]]]]
+
+
+class FileIndex(object):
+    """cases found in data folders, kept in a SQLite database. A folder is listed again only when its
+    mtime changes, and then only entries not seen before are probed, so a lookup on an unchanged folder
+    costs one stat. Entries that cannot be read yet, e.g. mid-conversion, are not stored and keep the
+    folder listed again on every update until they can. Entries modified in place keep their old cases
+    until rebuilt with force.
+
+    Args:
+        db_path: database file, created on first use
+    """
+    def __init__(self, db_path: str = INDEX_PATH) -> None:
+        self.db_path = expanduser(db_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        makedirs(dirname(self.db_path) or '.', exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=30.0)
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def update(self, folder: str, kind: str, force: bool = False) -> int:
+        """bring the index of folder up to date
+        Returns:
+            number of entries probed
+        """
+        folder, probe = abspath(expanduser(folder)), PROBES[kind]
+        mtime = stat(folder).st_mtime_ns
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT mtime FROM folders WHERE folder = ? AND kind = ?",
+                                     (folder, kind)).fetchone()
+            if row is not None and row[0] == mtime and not force:
+                return 0
+            if force:
+                connection.execute("DELETE FROM entries WHERE folder = ? AND kind = ?", (folder, kind))
+                connection.execute("DELETE FROM cases WHERE folder = ? AND kind = ?", (folder, kind))
+            known = {name for name, in connection.execute(
+                "SELECT name FROM entries WHERE folder = ? AND kind = ?", (folder, kind))}
+            current = set(listdir(folder))
+            removed = [(folder, kind, name) for name in known - current]
+            connection.executemany("DELETE FROM entries WHERE folder = ? AND kind = ? AND name = ?", removed)
+            connection.executemany("DELETE FROM cases WHERE folder = ? AND kind = ? AND name = ?", removed)
+            probed = {name: probe(folder, name) for name in sorted(current - known)}
+            added = {name: cases for name, cases in probed.items() if cases is not None}
+            connection.executemany("INSERT INTO entries VALUES (?, ?, ?)", [(folder, kind, name) for name in added])
+            connection.executemany("INSERT INTO cases VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(folder, kind, name, cage_id, animal_id, date.isoformat())
+                                    for name, cases in added.items() for cage_id, animal_id, date in cases])
+            pending = len(added) < len(probed)  # no mtime, so the folder is listed again next time
+            connection.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)",
+                               (folder, kind, None if pending else mtime))
+        return len(probed)
+
+    def ids(self, folder: str, kind: str, force: bool = False) -> IDs:
+        """{(cage_id, animal_id): [(date, path)]} of the files in folder, ordered by file name"""
+        self.update(folder, kind, force)
+        folder = abspath(expanduser(folder))
+        result = defaultdict(list)  # type: IDs
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT name, cage_id, animal_id, date FROM cases WHERE folder = ? AND kind = ? "
+                                      "ORDER BY name, rowid", (folder, kind)).fetchall()
+        for name, cage_id, animal_id, date in rows:
+            result[(cage_id, animal_id)].append((datetime.fromisoformat(date), join(folder, name)))
+        return result
+
+
+_default_index = None  # type: Optional[FileIndex]
+
+
+def default_index() -> FileIndex:
+    global _default_index
+    if _default_index is None:
+        _default_index = FileIndex()
+    return _default_index
@@ -0,0 +1,183 @@
+"""watch a drop folder for emka pastes and convert them as they arrive"""
+from typing import Dict, Iterator, Optional, Tuple, TextIO
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import io
+import select
+import shutil
+import struct
+import sys
+import threading
+from os import close, fsdecode, fsencode, read, remove, replace, scandir, stat, strerror
+from os.path import basename, exists, join, splitext
+
+from .naming import _extract_name, _is_valid_name
+
+EXTENSIONS = ('.txt', '.raw')
+HEAD_SIZE = 200  # characters of a paste holding its "File :" header line
+POLL_INTERVAL = 1.0  # s
+
+_IN_CLOSE_WRITE = 0x08
+_IN_MOVED_TO = 0x80
+_IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')
+
+
+def _name_of(head: str, fallback: str = '') -> Optional[str]:
+    """recording name from the paste header, or the dropped file name when the header has none"""
+    for name in (_extract_name(head), splitext(basename(fallback))[0]):
+        if name and _is_valid_name(name):
+            return name
+    return None
+
+
+def _convert(source: TextIO, name: str, target_folder: str) -> str:
+    from ..reader.breath.emka import convert_stream
+    target = join(target_folder, name)
+    if exists(target):
+        raise FileExistsError(errno.EEXIST, strerror(errno.EEXIST), target)
+    partial = target + '.partial'
+    try:
+        convert_stream(source, partial)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    replace(partial, target)
+    return target
+
+
+def ingest_text(content: str, target_folder: str) -> Optional[str]:
+    """convert a pasted recording held in memory, e.g. from the clipboard
+    Returns:
+        path of the converted file, None when the paste is not a validly named recording
+    """
+    name = _name_of(content[0: HEAD_SIZE])
+    return None if name is None else _convert(io.StringIO(content), name, target_folder)
+
+
+def ingest_file(file_name: str, target_folder: str, keep: bool = False) -> Optional[str]:
+    """convert a dropped paste file, streaming it from disk, and remove it unless keep
+    Returns:
+        path of the converted file, None when the file is not a validly named recording
+    """
+    with open(file_name, 'r') as source:
+        name = _name_of(source.read(HEAD_SIZE), file_name)
+        if name is None:
+            return None
+        source.seek(0)
+        target = _convert(source, name, target_folder)
+    if not keep:
+        remove(file_name)
+    return target
+
+
+def _is_paste(path: str) -> bool:
+    return splitext(path)[1].lower() in EXTENSIONS
+
+
+def _poll(folder: str, interval: float, stop: threading.Event) -> Iterator[str]:
+    """files whose size and mtime held still over one interval, each yielded once"""
+    seen = dict()  # type: Dict[str, Tuple[int, int]]
+    done = set()
+    while not stop.is_set():
+        current = dict()
+        for entry in scandir(folder):
+            if entry.is_file() and _is_paste(entry.path):
+                file_stat = entry.stat()
+                current[entry.path] = (file_stat.st_size, file_stat.st_mtime_ns)
+        for path, identity in current.items():
+            if path not in done and seen.get(path) == identity:
+                done.add(path)
+                yield path
+        done &= set(current)
+        seen = current
+        stop.wait(interval)
+
+
+def _inotify(folder: str, interval: float, stop: threading.Event) -> Iterator[str]:
+    """files closed after writing or moved into folder, files already there first"""
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    fd = libc.inotify_init1(_IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    try:
+        if libc.inotify_add_watch(fd, fsencode(folder), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed on " + folder)
+        for entry in scandir(folder):
+            if entry.is_file() and _is_paste(entry.path):
+                yield entry.path
+        while not stop.is_set():
+            if not select.select([fd], [], [], interval)[0]:
+                continue
+            buffer, offset = read(fd, 1 << 16), 0
+            while offset < len(buffer):
+                _, _, _, length = _EVENT.unpack_from(buffer, offset)
+                name = fsdecode(buffer[offset + _EVENT.size: offset + _EVENT.size + length].rstrip(b'\0'))
+                offset += _EVENT.size + length
+                if _is_paste(name):
+                    yield join(folder, name)
+    finally:
+        close(fd)
+
+
+def watch(folder: str, interval: float = POLL_INTERVAL, stop: Optional[threading.Event] = None,
+          poll: bool = False) -> Iterator[str]:
+    """paste files that finished arriving in folder, with inotify on linux and by polling elsewhere
+    Args:
+        folder: drop folder
+        interval: polling interval, and how often a stop request is checked, in s
+        stop: ends the iteration when set
+        poll: poll even when inotify is available, e.g. for network mounts that do not report events
+    """
+    stop = stop or threading.Event()
+    if not poll and sys.platform.startswith('linux'):
+        return _inotify(folder, interval, stop)
+    return _poll(folder, interval, stop)
+
+
+def run(drop_folder: str, target_folder: str, keep: bool = False, interval: float = POLL_INTERVAL,
+        stop: Optional[threading.Event] = None, poll: bool = False) -> None:
+    """convert every paste dropped into drop_folder into target_folder until stopped. A file reported
+    again unchanged, e.g. by both the initial scan and inotify, is converted once."""
+    handled = dict()  # type: Dict[str, Tuple[int, int]]
+    for file_name in watch(drop_folder, interval, stop, poll):
+        try:
+            file_stat = stat(file_name)
+        except FileNotFoundError:  # converted and removed when first reported
+            handled.pop(file_name, None)
+            continue
+        identity = (file_stat.st_size, file_stat.st_mtime_ns)
+        if handled.get(file_name) == identity:
+            continue
+        handled[file_name] = identity
+        try:
+            target = ingest_file(file_name, target_folder, keep)
+        except FileExistsError as error:
+            print("\tskipped {}, already converted to {}".format(file_name, error.filename))
+            continue
+        except (OSError, ValueError) as error:
+            print("\tfailed to convert {}: {!r}".format(file_name, error))
+            continue
+        if target is None:
+            print("\tskipped {}, not a validly named recording".format(file_name))
+        else:
+            print("\tsaved file {}".format(target))
+
+
+def main(argv=None) -> None:
+    from .config import get_config
+    parser = argparse.ArgumentParser(description="convert emka pastes dropped into a folder")
+    parser.add_argument('drop_folder')
+    parser.add_argument('target_folder', nargs='?', help="defaults to breath_folder in behavior.json")
+    parser.add_argument('-k', '--keep', action='store_true', help="keep the text files after conversion")
+    parser.add_argument('-p', '--poll', action='store_true', help="poll instead of using inotify")
+    parser.add_argument('-i', '--interval', type=float, default=POLL_INTERVAL)
+    args = parser.parse_args(argv)
+    print("Watching {}".format(args.drop_folder))
+    try:
+        run(args.drop_folder, args.target_folder or get_config()['breath_folder'], args.keep, args.interval,
+            poll=args.poll)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,229 @@
+"""opt-in timing of named pipeline stages: wall time, samples processed and peak allocation.
+
+Off by default, stages then cost one flag check. Turn it on for a block of code
+
+    >>> with profiling() as profile:
+    ...     breath_exp()
+    >>> print(profile.summary())
+
+or for a whole process by setting BEHAVIOR_PROFILE: to 1 to print the summary on exit, or to a file name
+to save the records as json, where {pid} is replaced by the process id for pools of workers.
+Peak allocation comes from tracemalloc, which slows allocation heavy code while profiling is on. Stages
+nest: a stage's peak includes the stages inside it. tracemalloc keeps one peak for all threads, which each
+stage resets, so peaks are only recorded for stages in the main thread and are None for the others, e.g.
+the stages of pipeline.threaded. A main thread peak includes what other threads allocated meanwhile."""
+from typing import Callable, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+import atexit
+import json
+import os
+import threading
+import tracemalloc
+
+ENV_VAR = 'BEHAVIOR_PROFILE'
+
+
+class _Frame(object):
+    """one stage in progress, samples can be set while it runs"""
+    __slots__ = ('name', 'samples', 'start', 'base', 'peak')
+
+    def __init__(self, name: str, samples: Optional[int]) -> None:
+        self.name, self.samples = name, samples
+        self.start, self.base, self.peak = 0.0, None, 0  # base stays None outside the main thread
+
+
+class _NullFrame(object):
+    __slots__ = ()
+
+    def __setattr__(self, key, value) -> None:
+        pass
+
+    def __enter__(self) -> "_NullFrame":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+_NULL_FRAME = _NullFrame()
+
+
+class Profile(object):
+    """records of finished stages, in the order they finished"""
+    def __init__(self) -> None:
+        self.records = list()  # type: List[Dict]
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def totals(self) -> Dict[str, Dict]:
+        """per stage: calls, total seconds, total samples, samples per second and largest peak, None
+        when no call recorded a peak"""
+        result = dict()  # type: Dict[str, Dict]
+        for record in self.records:
+            total = result.setdefault(record['stage'], {'calls': 0, 'seconds': 0.0, 'samples': 0, 'peak_mb': None})
+            total['calls'] += 1
+            total['seconds'] += record['seconds']
+            total['samples'] += record['samples'] or 0
+            if record['peak_mb'] is not None:
+                total['peak_mb'] = max(total['peak_mb'] or 0.0, record['peak_mb'])
+        for total in result.values():
+            total['rate'] = total['samples'] / total['seconds'] if total['samples'] and total['seconds'] else None
+        return result
+
+    def summary(self) -> str:
+        """table of totals, slowest stage first"""
+        lines = ["{:<32}{:>7}{:>11}{:>14}{:>16}{:>11}".format('stage', 'calls', 'time (s)', 'samples', 'samples/s',
+                                                            'peak (MB)')]
+        totals = sorted(self.totals().items(), key=lambda item: -item[1]['seconds'])
+        for name, total in totals:
+            rate = '' if total['rate'] is None else '{:.4g}'.format(total['rate'])
+            peak = '' if total['peak_mb'] is None else '{:.1f}'.format(total['peak_mb'])
+            lines.append("{:<32}{calls:>7}{seconds:>11.3f}{samples:>14}{:>16}{:>11}".format(
+                name, rate, peak, **total))
+        return "\n".join(lines)
+
+    def to_json(self, file_path: Optional[str] = None) -> str:
+        """records and totals as json, saved to file_path when given"""
+        text = json.dumps({'records': self.records, 'totals': self.totals()}, indent=4)
+        if file_path is not None:
+            with open(file_path, 'w') as fp:
+                fp.write(text)
+        return text
+
+
+_active = None  # type: Optional[Profile]
+_tracing = False  # whether start turned tracemalloc on
+_stacks = threading.local()
+
+
+def _stack() -> List[_Frame]:
+    if not hasattr(_stacks, 'frames'):
+        _stacks.frames = list()
+    return _stacks.frames
+
+
+def _enter(name: str, samples: Optional[int]) -> _Frame:
+    frame, stack = _Frame(name, samples), _stack()
+    if threading.current_thread() is threading.main_thread():
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        tracemalloc.reset_peak()
+        frame.base, frame.peak = current, current
+    stack.append(frame)
+    frame.start = perf_counter()
+    return frame
+
+
+def _exit(frame: _Frame, profile: Profile) -> None:
+    seconds = perf_counter() - frame.start
+    stack = _stack()
+    stack.pop()
+    peak_mb = None
+    if frame.base is not None:
+        peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        peak_mb = (peak - frame.base) / 2 ** 20
+    profile.add({'stage': frame.name, 'seconds': seconds, 'samples': frame.samples, 'peak_mb': peak_mb,
+                 'thread': threading.current_thread().name})
+
+
+@contextmanager
+def _timed(name: str, samples: Optional[int], profile: Profile) -> Iterator[_Frame]:
+    frame = _enter(name, samples)
+    try:
+        yield frame
+    finally:
+        _exit(frame, profile)
+
+
+def stage(name: str, samples: Optional[int] = None):
+    """context manager timing the code inside as stage name while profiling is on. The frame it gives
+    takes the sample count when it is only known at the end: `with stage('decode') as frame: ...;
+    frame.samples = n`."""
+    if _active is None:
+        return _NULL_FRAME
+    return _timed(name, samples, _active)
+
+
+def _count(value) -> Optional[int]:
+    size = getattr(value, 'size', None)  # arrays
+    return size if isinstance(size, int) else None
+
+
+def instrumented(name: str, count: Optional[Callable[..., Optional[int]]] = None):
+    """decorator timing every call as stage name. count(*args, **kwargs) gives the samples processed,
+    by default the size of the first argument when it is an array."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            samples = count(*args, **kwargs) if count else (_count(args[0]) if args else None)
+            with _timed(name, samples, _active):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enabled() -> bool:
+    return _active is not None
+
+
+def start(profile: Optional[Profile] = None) -> Profile:
+    """turn profiling on for the whole process until stop"""
+    global _active, _tracing
+    _active = profile or Profile()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _tracing = True
+    return _active
+
+
+def stop() -> Optional[Profile]:
+    global _active, _tracing
+    profile, _active = _active, None
+    if _tracing:
+        tracemalloc.stop()
+        _tracing = False
+    return profile
+
+
+@contextmanager
+def profiling(json_path: Optional[str] = None) -> Iterator[Profile]:
+    """profile the stages run inside the block, saving the records to json_path at the end if given"""
+    previous = _active
+    if previous is not None:  # already on, e.g. through BEHAVIOR_PROFILE, keep recording there
+        yield previous
+        return
+    profile = start()
+    try:
+        yield profile
+    finally:
+        stop()
+        if json_path is not None:
+            profile.to_json(json_path)
+
+
+def _from_environment() -> None:
+    value = os.environ.get(ENV_VAR, '')
+    if value in ('', '0'):
+        return
+    profile = start()
+
+    @atexit.register
+    def report():
+        stop()
+        if value.lower() in ('1', 'true', 'yes'):
+            print(profile.summary())
+        else:
+            profile.to_json(value.format(pid=os.getpid()))
+
+
+_from_environment()
@@ -0,0 +1,24 @@
+"""names of emka recordings, as the emka software writes them in the header of a paste"""
+from datetime import datetime
+from os.path import splitext
+
+
+def _extract_name(content: str) -> str:
+    line_start = content.find("File : \t")
+    file_path = content[line_start + 8: content.find("\n", line_start)]
+    return splitext(file_path[file_path.rfind("\\") + 1:])[0]
+
+
+def _is_valid_name(name: str) -> bool:
+    name = name.replace('-', '_')
+    if '_' not in name:
+        return False
+    date = name.split('_')[-1]
+    try:
+        datetime.strptime(date, "%Y%m%d")
+    except ValueError:
+        try:
+            datetime.strptime(date, "%m%d%y")
+        except ValueError:
+            return False
+    return True
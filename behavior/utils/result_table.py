@@ -1,27 +1,21 @@
 """auto-generate case list for groups"""
 from typing import List, Tuple, Optional, Callable, Union, Dict, Sequence
-from pathlib import Path
 import json
-from collections import defaultdict
-from datetime import datetime
 from os import listdir, chdir
-from os.path import join, isdir
+from os.path import isdir
 
 import numpy as np
 import pandas as pd
-from noformat import File, isFile
 
 from .cage_table import Animals
+from .config import get_config
+from .file_index import IDs, default_index
+from .instrument import instrumented, stage
 
 Real = Union[int, float]
 _GENOTYPES = {0: 'unknown', 1: 'wt', 2: 'ko', 3: 'wt', 4: 'ko'}
 _EXPERIMENT_DATES = [28, 42, 56]
 
-proj_folder = Path("~/Sync/project/2016-mecp2-bumetanide").expanduser()
-grouping = json.load(proj_folder.joinpath("data", "index", "grouping.json").open("r"))
-res = list()
-for key, value in grouping.items():
-    res.append()
 
 def _approximate(number: Real, target: Sequence[Real], tolerance: Real) -> Optional[Real]:
     target = np.asarray(target)
@@ -36,79 +30,92 @@ def _approximate(number: Real, target: Sequence[Real], tolerance: Real) -> Optio
         return None
 
 
-IDs = Dict[Tuple[int, int], List[Tuple[datetime, str]]]
-
-
 def _decode_pheno_id(folder: str) -> IDs:
-    result = defaultdict(list)  # type: Dict[Tuple[int, int], List[Tuple[datetime, str]]]
-    for file_name in listdir(folder):
-        if not isdir(join(folder, file_name)):
-            continue
-        ids = File(join(folder, file_name)).attrs['id']
-        for id_str in ids:
-            date = datetime.strptime(file_name, '%Y%m%d')
-            result[(id_str // 1000, id_str % 1000)].append((date, join(folder, file_name)))
-    return result
+    with stage('result_table.index'):
+        return default_index().ids(folder, 'pheno')
 
 
 def _decode_emka_naming(folder: str) -> IDs:
-    result = defaultdict(list)  # type: Dict[Tuple[int, int], List[Tuple[datetime, str]]]
-    for file_name in listdir(folder):
-        if isFile(join(folder, file_name)):
-            cage_id, animal_id, exp_date_str, *postfix = file_name.split('-')
-            date = datetime.strptime(exp_date_str, '%Y%m%d')
-            result[(int(cage_id), int(animal_id))].append((date, join(folder, file_name)))
-    return result
+    with stage('result_table.index'):
+        return default_index().ids(folder, 'emka')
+
+
+def _match_days(days: np.ndarray, target: Sequence[Real], tolerance: Real) -> np.ndarray:
+    """_approximate over an array, unmatched days are nan: the closest target below within
+    tolerance wins, otherwise the closest one at or above"""
+    target = np.asarray(target, dtype=np.float64)
+    index = np.searchsorted(target, days)
+    lower = target[np.maximum(index - 1, 0)] if len(target) else np.zeros(len(days))
+    upper = target[np.minimum(index, len(target) - 1)] if len(target) else np.zeros(len(days))
+    lower_ok = (index > 0) & (days - lower <= tolerance)
+    upper_ok = (index < len(target)) & (upper - days <= tolerance)
+    return np.where(lower_ok, lower, np.where(upper_ok, upper, np.nan))
 
 
+@instrumented('result_table.match', lambda index, cage_info, ids, *args, **kwargs: sum(map(len, ids.values())))
 def _find_exp_file(index: pd.MultiIndex, cage_info: Animals, ids: IDs,
                    dates: Sequence[int], tolerance: int = 4) -> pd.DataFrame:
-    result = pd.DataFrame(columns=dates, index=index)
-    for case_id in ids:
-        if case_id not in index:
-            continue
-        for exp_date, case_path in ids[case_id]:
-            exp_day = _approximate((exp_date - cage_info[case_id[0]]['DOB']).days, dates, tolerance)
-            if exp_day is not None:
-                result.loc[case_id, exp_day] = case_path
+    """table of experiment files with cases in rows and days of age in columns. Each file goes to the
+    experiment day closest to the age of the animal, within tolerance, later files win duplicates."""
+    cases = set(index)
+    records = pd.DataFrame([(cage_id, animal_id, exp_date, case_path)
+                            for (cage_id, animal_id), files in ids.items() if (cage_id, animal_id) in cases
+                            for exp_date, case_path in files],
+                           columns=['cage_id', 'animal_id', 'exp_date', 'path'])
+    if len(records) > 0:
+        dobs = {cage_id: cage_info[cage_id]['DOB'] for cage_id in records['cage_id'].unique()}
+        records['DOB'] = pd.to_datetime(records['cage_id'].map(dobs))
+        days = (pd.to_datetime(records['exp_date']) - records['DOB']).dt.days.to_numpy(np.float64)
+        records['day'] = _match_days(days, dates, tolerance)
+        records = records.dropna(subset=['day']).drop_duplicates(['cage_id', 'animal_id', 'day'], keep='last')
+        records['day'] = records['day'].map(dict(zip(np.asarray(dates, dtype=np.float64), dates)))
+    if len(records) == 0:
+        return pd.DataFrame(columns=dates, index=index)
+    result = records.pivot(index=['cage_id', 'animal_id'], columns='day', values='path')
+    result = result.reindex(index=index, columns=dates).astype(object)
+    result.columns.name = None
     return result
 
 
-def exp_table(folder: str, func: Callable[[str], IDs], grouping: str = config['group_config'],
+@instrumented('result_table.exp_table')
+def exp_table(folder: str, func: Callable[[str], IDs], grouping: Optional[str] = None,
               experiment_dates: List[int] = _EXPERIMENT_DATES) -> pd.DataFrame:
-    """get a table of experiments done based on folder and animal_id decoder"""
+    """get a table of experiments done based on folder and animal_id decoder,
+    grouping defaults to group_config in behavior.json"""
+    config = get_config()
     def read_grouping(struct: Dict[str, Tuple[str, str]]) -> List[Tuple[Tuple[int, int], str]]:
         return [((int(cage), int(mouse)), key) for key, value in struct.items() for cage, mouse in value]
-    case_ids, groupings = zip(*read_grouping(json.load(open(grouping))))
+    case_ids, groupings = zip(*read_grouping(json.load(open(grouping or config['group_config']))))
     index, permutation = pd.MultiIndex.from_tuples(case_ids, names=('cage_id', 'animal_id')).sortlevel()
     groupings = np.asarray(groupings)[np.asarray(permutation)]
-    result = _find_exp_file(index, Animals(config['animal_config']), func(folder), experiment_dates)
+    result = _find_exp_file(index, Animals.load(config['animal_config']), func(folder), experiment_dates)
     result['grouping'] = groupings
     return result
 
 
+@instrumented('result_table.find_grouping')
 def find_grouping(data_folder: str, func: Callable[[str], IDs]):
     chdir(data_folder)
     cases = [tuple(map(int, x.split('-')[0: 2])) for x in listdir(data_folder) if isdir(x)]
     cases = sorted(set(cases))
     index = pd.MultiIndex.from_tuples(cases, names=('cage_id', 'animal_id'))
-    animals = Animals(config['animal_config'])
+    animals = Animals.load(get_config()['animal_config'])
     result = _find_exp_file(index, animals, func(data_folder), _EXPERIMENT_DATES)
     genotype = [_GENOTYPES[animals[cage_id][animal_id]] for cage_id, animal_id in cases]
     result['genotype'] = genotype
     return result
 
 
-def breath_exp(experiment_dates: List[int] = _EXPERIMENT_DATES, grouping: str = config['group_config']) -> pd.DataFrame:
-    return exp_table(config['breath_folder'], _decode_emka_naming, grouping, experiment_dates)
+def breath_exp(experiment_dates: List[int] = _EXPERIMENT_DATES, grouping: Optional[str] = None) -> pd.DataFrame:
+    return exp_table(get_config()['breath_folder'], _decode_emka_naming, grouping, experiment_dates)
 
 
 def breath_grouping() -> pd.DataFrame:
-    return find_grouping(config['breath_folder'], _decode_emka_naming)
+    return find_grouping(get_config()['breath_folder'], _decode_emka_naming)
 
 
-def motion_exp(experiment_dates: List[int] = _EXPERIMENT_DATES, grouping: str = config['group_config']) -> pd.DataFrame:
-    return exp_table(config['motion_folder'], _decode_pheno_id, grouping, experiment_dates)
+def motion_exp(experiment_dates: List[int] = _EXPERIMENT_DATES, grouping: Optional[str] = None) -> pd.DataFrame:
+    return exp_table(get_config()['motion_folder'], _decode_pheno_id, grouping, experiment_dates)
 
 
 def filter_by_col(table: pd.DataFrame, cols: List[Union[List[Union[str, int]], str, int]]) -> pd.DataFrame:
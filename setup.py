@@ -5,9 +5,12 @@ setup(
     name='behavior',
     version='0.1',
     packages=find_packages(exclude=['test', 'data', 'data.*', '*.test', '*.test.*', 'test.*']),
+    package_data={'behavior.utils': ['behavior.json']},
     entry_points={'gui_scripts': ['emka_conv=behavior.reader.breath:convert',
                                   'emka_save=behavior.utils:emka_save',
-                                  'motion_conv=behavior.reader.motion:convert']},
+                                  'motion_conv=behavior.reader.motion:convert'],
+                  'console_scripts': ['behavior_conv=behavior.reader.batch:main',
+                                      'behavior_ingest=behavior.utils.ingest:main']},
     author='Keji Li',
     author_email='mail@keji.li',
     install_requires=['numpy', 'scipy', 'pandas', 'openpyxl', 'numba', 'noformat', 'uifunc'],